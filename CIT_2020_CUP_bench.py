@@ -0,0 +1,165 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Benchmarks of the replication workload on synthetic data
+#
+# Each benchmark mirrors an estimation call of the replication scripts. It
+# runs on synthetic datasets whose score, outcome and covariates follow the
+# polecon or senate data, at increasing sizes. Reported per call: wall time,
+# peak traced memory and the scaling exponent (slope of log time on log n).
+# Results can be saved as a baseline and later runs compared against it.
+#
+# Usage:
+#   python CIT_2020_CUP_bench.py --sizes 1000 10000 100000 --save bench_baseline.json
+#   python CIT_2020_CUP_bench.py --compare bench_baseline.json
+#   python CIT_2020_CUP_bench.py --max-size 10000000 --only rdrobust
+#-----------------------------------------------------------------------------#
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+def synthetic(dataset, n, seed = 0):
+    """Synthetic data of size n matching the marginals of a replication dataset.
+
+    X is drawn from a smoothed bootstrap of the observed score (clipped to its
+    range), Y is the observed global quartic fit on each side of the cutoff
+    plus resampled residuals, and the covariates and cluster variable are
+    resampled by row, keeping their joint distribution.
+    """
+    from CIT_2020_CUP_data import DATASETS, load_dataset
+
+    spec = DATASETS[dataset]
+    data = load_dataset(dataset)
+    rng = np.random.default_rng(seed)
+    x_obs = data.X.to_numpy(dtype = float)
+    y_obs = data.Y.to_numpy(dtype = float)
+    bw = 1.06 * x_obs.std() * len(x_obs)**(-1 / 5)
+    X = rng.choice(x_obs, n) + rng.normal(0, bw, n)
+    X = np.clip(X, x_obs.min(), x_obs.max())
+    Y = np.empty(n)
+    for side_obs, side in ((x_obs < 0, X < 0), (x_obs >= 0, X >= 0)):
+        fit = np.polynomial.Polynomial.fit(x_obs[side_obs], y_obs[side_obs], 4)
+        resid = y_obs[side_obs] - fit(x_obs[side_obs])
+        Y[side] = fit(X[side]) + rng.choice(resid, side.sum())
+    cols = list(spec['covs']) + ([spec['cluster']] if spec.get('cluster') else [])
+    out = data[cols].iloc[rng.integers(0, len(data), n)].reset_index(drop = True)
+    out['X'] = X
+    out['Y'] = Y
+    return out
+
+
+def _calls(spec):
+    from rdrobust import rdrobust, rdbwselect, rdplot
+    import rddensity
+
+    covs, cluster = spec['covs'], spec.get('cluster')
+    calls = {
+        'rdrobust': lambda d: rdrobust(d.Y, d.X, kernel = 'triangular', p = 1, bwselect = 'mserd'),
+        'rdrobust_covs': lambda d: rdrobust(d.Y, d.X, covs = d[covs], kernel = 'triangular',
+                                            scaleregul = 1, p = 1, bwselect = 'mserd'),
+        'rdbwselect_all': lambda d: rdbwselect(d.Y, d.X, kernel = 'triangular', p = 1, all = True),
+        'rdplot_es': lambda d: rdplot(d.Y, d.X, binselect = 'es', hide = True),
+        'rdplot_qs': lambda d: rdplot(d.Y, d.X, binselect = 'qs', hide = True),
+        'rdplot_esmv': lambda d: rdplot(d.Y, d.X, binselect = 'esmv', hide = True),
+        'rdplot_qsmv': lambda d: rdplot(d.Y, d.X, binselect = 'qsmv', hide = True),
+        'rddensity': lambda d: rddensity.rddensity(X = d.X),
+    }
+    if cluster:
+        calls['rdrobust_cluster'] = lambda d: rdrobust(d.Y, d.X, kernel = 'triangular', scaleregul = 1,
+                                                       p = 1, bwselect = 'mserd', cluster = d[cluster])
+        calls['rdrobust_covs_cluster'] = lambda d: rdrobust(d.Y, d.X, covs = d[covs], kernel = 'triangular',
+                                                            scaleregul = 1, p = 1, bwselect = 'mserd',
+                                                            cluster = d[cluster])
+    return calls
+
+
+def run(datasets = ('polecon', 'senate'), sizes = (1000, 10000, 100000), only = None,
+        repeat = 1, seed = 0):
+    """Benchmark every call on every size; returns a DataFrame of timings."""
+    from CIT_2020_CUP_data import DATASETS
+
+    rows = []
+    for dataset in datasets:
+        calls = _calls(DATASETS[dataset])
+        for n in sizes:
+            data = synthetic(dataset, n, seed)
+            for name, call in calls.items():
+                if only and not any(name.startswith(o) for o in only):
+                    continue
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    # Timed runs without tracemalloc, whose hooks slow every
+                    # allocation; peak memory comes from one extra traced run
+                    times = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        call(data)
+                        times.append(time.perf_counter() - start)
+                    tracemalloc.start()
+                    try:
+                        call(data)
+                        peak = tracemalloc.get_traced_memory()[1]
+                    finally:
+                        tracemalloc.stop()
+                rows.append({'dataset': dataset, 'call': name, 'n': n,
+                             'seconds': min(times), 'peak_mb': peak / 2**20})
+    return pd.DataFrame(rows)
+
+
+def scaling(results):
+    """Scaling exponent per (dataset, call): slope of log seconds on log n."""
+    def slope(g):
+        if g.n.nunique() < 2:
+            return np.nan
+        return np.polyfit(np.log(g.n), np.log(g.seconds), 1)[0]
+    return (results.groupby(['dataset', 'call'])[['n', 'seconds']]
+            .apply(slope).rename('exponent').reset_index())
+
+
+def compare(results, baseline, tolerance = 1.25):
+    """Rows whose time exceeds the baseline's by more than `tolerance`x."""
+    merged = results.merge(baseline, on = ['dataset', 'call', 'n'], suffixes = ('', '_base'))
+    merged['ratio'] = merged.seconds / merged.seconds_base
+    return merged[merged.ratio > tolerance]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Benchmark the replication estimation calls.")
+    parser.add_argument('datasets', nargs = '*', default = ['polecon', 'senate'])
+    parser.add_argument('--sizes', nargs = '+', type = int)
+    parser.add_argument('--max-size', type = int, default = 10**5,
+                        help = "powers of ten from 10^3 up to this size (default 10^5)")
+    parser.add_argument('--only', nargs = '+', help = "call name prefixes to run")
+    parser.add_argument('--repeat', type = int, default = 1)
+    parser.add_argument('--save', help = "write results as a JSON baseline")
+    parser.add_argument('--compare', help = "JSON baseline to check for regressions")
+    parser.add_argument('--tolerance', type = float, default = 1.25)
+    args = parser.parse_args()
+
+    sizes = args.sizes or [10**k for k in range(3, int(np.log10(args.max_size)) + 1)]
+    results = run(args.datasets, sizes, args.only, args.repeat)
+    pd.set_option('display.width', 120)
+    print(results.to_string(index = False))
+    print()
+    print(scaling(results).to_string(index = False))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results.to_dict(orient = 'records'), f, indent = 1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = pd.DataFrame(json.load(f))
+        slow = compare(results, baseline, args.tolerance)
+        if len(slow):
+            print()
+            print("Regressions:")
+            print(slow[['dataset', 'call', 'n', 'seconds', 'seconds_base', 'ratio']].to_string(index = False))
+            sys.exit(1)
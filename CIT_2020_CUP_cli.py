@@ -0,0 +1,187 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Command-line entry point for single analyses
+#
+# Importing rdrobust takes about two seconds (it loads scipy.stats,
+# matplotlib and plotnine) and rddensity almost as long, which dominates a
+# job that needs one estimate. Here the top level imports only argparse and
+# each subcommand imports what it uses, when it runs:
+#   estimate, bwselect, density  look the specification up in the result
+#                                store (CIT_2020_CUP_store) and import the
+#                                estimation package only when it is missing
+#   plot                         binned means from CIT_2020_CUP_binning and a
+#                                global polynomial fit, without rdrobust;
+#                                matplotlib is loaded only to write --out
+#   falsify                      the Section 5 table (rdrobust per covariate)
+#
+# Usage:
+#   python CIT_2020_CUP_cli.py estimate senate --bwselect mserd
+#   python CIT_2020_CUP_cli.py estimate polecon --covs --cluster
+#   python CIT_2020_CUP_cli.py bwselect senate --all
+#   python CIT_2020_CUP_cli.py plot polecon --y lpop1994 --binselect qs --out lpop.png
+#   python CIT_2020_CUP_cli.py density senate
+#   python CIT_2020_CUP_cli.py falsify polecon --workers 4
+#-----------------------------------------------------------------------------#
+
+import argparse
+import sys
+
+
+def _spec(args):
+    # Estimation arguments given on the command line, plus covs/cluster names
+    from CIT_2020_CUP_data import DATASETS
+
+    kw = {k: getattr(args, k) for k in ('c', 'p', 'h', 'kernel', 'bwselect', 'vce')
+          if getattr(args, k, None) is not None}
+    if getattr(args, 'all', False):
+        kw['all'] = True
+    spec = DATASETS.get(args.dataset, {})
+    covs = args.covs if args.covs else (spec.get('covs') if args.covs is not None else None)
+    cluster = args.cluster if args.cluster != '' else spec.get('cluster')
+    if covs or cluster:
+        # As Snippets 25-28
+        kw.setdefault('scaleregul', 1)
+    return kw, covs or None, cluster
+
+
+def _record(func, args, kw, covs = None, cluster = None):
+    from CIT_2020_CUP_data import dataset_hash
+    from CIT_2020_CUP_store import ResultStore
+
+    # Hashed once for the lookup and the key of the stored record
+    data_hash = dataset_hash(args.dataset)
+    with ResultStore() as store:
+        store.record(args.dataset, None, func, kw, covs, cluster, data_hash, args.y, args.x)
+    key = store.spec_key(args.dataset, func, kw, covs, cluster, data_hash, args.y, args.x)[0]
+    return store, key
+
+
+def cmd_estimate(args):
+    import pandas as pd
+
+    kw, covs, cluster = _spec(args)
+    store, key = _record('rdrobust', args, kw, covs, cluster)
+    est = store.table('estimates').set_index('key').loc[key]
+    bws = store.table('bandwidths').set_index('key').loc[[key]].iloc[0]
+    print(f"Sharp RD estimates: {args.y} on {args.x}, {est.kernel} kernel, p = {est.p}, "
+          f"{est.bwselect} bandwidth, vce = {est.vce}")
+    print(f"N = {est.N_l} | {est.N_r}   N_h = {est.N_h_l} | {est.N_h_r}   "
+          f"h = {bws.h_l:.3f} | {bws.h_r:.3f}   b = {bws.b_l:.3f} | {bws.b_r:.3f}")
+    table = pd.DataFrame({label: [est[f'{stat}_{kind}'] for stat in ('coef', 'se', 'pv', 'ci_l', 'ci_r')]
+                          for kind, label in (('cl', 'Conventional'), ('bc', 'Bias-Corrected'),
+                                              ('rb', 'Robust'))},
+                         index = ['Coef.', 'Std. Err.', 'P>|z|', 'CI Lower', 'CI Upper']).T
+    print(table.to_string())
+
+
+def cmd_bwselect(args):
+    kw, covs, cluster = _spec(args)
+    store, key = _record('rdbwselect', args, kw, covs, cluster)
+    bws = store.table('bandwidths')
+    print(bws[bws.key == key].drop(columns = 'key').to_string(index = False))
+
+
+def cmd_density(args):
+    kw = {'c': args.c} if args.c is not None else {}
+    store, key = _record('rddensity', args, kw)
+    dens = store.table('density').set_index('key').loc[key]
+    print(f"Manipulation test (rddensity) of {args.x}: T = {dens.t_jk:.4f}, P>|T| = {dens.p_jk:.4f}")
+    print(f"N = {dens.N_l:.0f} | {dens.N_r:.0f}   N_h = {dens.N_h_l:.0f} | {dens.N_h_r:.0f}   "
+          f"h = {dens.h_l:.3f} | {dens.h_r:.3f}")
+
+
+def cmd_plot(args):
+    import numpy as np
+    from CIT_2020_CUP_binning import BinIndex
+    from CIT_2020_CUP_data import load_dataset
+
+    data = load_dataset(args.dataset)
+    c = args.c or 0
+    y, x = data[args.y].to_numpy(dtype = float), data[args.x].to_numpy(dtype = float)
+    bins = BinIndex(y, x, c).bins(args.binselect, args.nbins)
+    if not args.out:
+        print(bins.to_string(index = False))
+        return
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    ax.scatter(bins.rdplot_mean_bin, bins.rdplot_mean_y, s = 12, color = 'darkblue')
+    ok = ~(np.isnan(x) | np.isnan(y))
+    for side in (ok & (x < c), ok & (x >= c)):
+        # rdplot's global polynomial (uniform kernel) on each side
+        fit = np.polynomial.Polynomial.fit(x[side], y[side], args.p)
+        grid = np.linspace(x[side].min(), x[side].max(), 500)
+        ax.plot(grid, fit(grid), color = 'red')
+    ax.axvline(c, color = 'black', linewidth = 0.8)
+    ax.set_xlabel(args.x)
+    ax.set_ylabel(args.y)
+    fig.savefig(args.out)
+    print(f"wrote {args.out}")
+
+
+def cmd_falsify(args):
+    import pandas as pd
+    from CIT_2020_CUP_data import DATASETS, load_dataset
+    from CIT_2020_CUP_falsification import falsification_table
+
+    covariates = args.covariates or DATASETS[args.dataset]['falsification']
+    table = falsification_table(load_dataset(args.dataset), covariates, x = args.x,
+                                workers = args.workers, bwselect = args.bwselect)
+    pd.set_option('display.width', 120)
+    print(table.to_string())
+
+
+def parser():
+    top = argparse.ArgumentParser(prog = 'CIT_2020_CUP_cli.py',
+                                  description = "Single RD analyses of a replication dataset.")
+    sub = top.add_subparsers(dest = 'command', required = True)
+
+    def command(name, func, summary):
+        p = sub.add_parser(name, help = summary)
+        p.add_argument('dataset', help = "DATASETS name (polecon, senate) or .csv/.dta path")
+        p.add_argument('--x', default = 'X', help = "score column")
+        p.add_argument('--c', type = float, help = "cutoff (default 0)")
+        p.set_defaults(func = func)
+        return p
+
+    def estimation(p):
+        p.add_argument('--y', default = 'Y', help = "outcome column")
+        p.add_argument('--p', type = int)
+        p.add_argument('--kernel')
+        p.add_argument('--vce')
+        p.add_argument('--covs', nargs = '*', help = "covariates (no names: the dataset's)")
+        p.add_argument('--cluster', nargs = '?', const = '', help = "cluster column (no name: the dataset's)")
+        return p
+
+    p = estimation(command('estimate', cmd_estimate, "rdrobust estimate"))
+    p.add_argument('--h', type = float, help = "bandwidth (default: selected by --bwselect)")
+    p.add_argument('--bwselect')
+    p = estimation(command('bwselect', cmd_bwselect, "rdbwselect bandwidths"))
+    p.add_argument('--bwselect')
+    p.add_argument('--all', action = 'store_true', help = "every bandwidth selector")
+    p = command('plot', cmd_plot, "RD plot data (binned means), or an image with --out")
+    p.add_argument('--y', default = 'Y', help = "outcome column")
+    p.add_argument('--binselect', default = 'esmv')
+    p.add_argument('--nbins', type = int, nargs = '+')
+    p.add_argument('--p', type = int, default = 4, help = "order of the global polynomial fit")
+    p.add_argument('--out', help = "image file (png, svg, pdf)")
+    p = command('density', cmd_density, "rddensity manipulation test")
+    p.set_defaults(y = 'Y')
+    p = command('falsify', cmd_falsify, "RD estimates on predetermined covariates (Section 5)")
+    p.add_argument('--covariates', nargs = '+')
+    p.add_argument('--bwselect', default = 'cerrd')
+    p.add_argument('--workers', type = int)
+    return top
+
+
+def main(argv = None):
+    args = parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Loading the replication datasets through a columnar binary cache
+#
+# The first load of a dataset parses its .csv or .dta source, applies the
+# dataset's cleaning (dropna, derived X/Y/T) and writes one typed .npy file
+# per column to .rdcache/data/<source>-<path hash>/. Later loads memory-map those files,
+# so no parsing happens. The cache is rebuilt when the source's sha256 (checked
+# whenever its size or modification time changes) or the dataset spec
+# changes.
+#-----------------------------------------------------------------------------#
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from CIT_2020_CUP_utils import digest, file_digest
+
+# Source file, cleaning steps and analysis settings of each replication
+# dataset. `derive` maps a new column to an existing one; deriving X also
+# derives T = 1(X >= cutoff). `h` is the hand-picked bandwidth of Snippets
+# 8-14, `covs` the covariates of Snippets 25-28, `cluster` the cluster
+# variable of Snippets 27-28, `bootstrap` the resampling unit of the cluster
+# bootstrap, `falsification` the predetermined covariates of Section 5,
+# `figure16` those plotted in Figure 16 (with their rdplot axis limits) and
+# `figure17` those plotted in Figure 17.
+DATASETS = {
+    'polecon': {'source': 'CIT_2020_CUP_polecon.csv',
+                'h': 20,
+                'covs': ['vshr_islam1994', 'partycount', 'lpop1994', 'merkezi',
+                         'merkezp', 'subbuyuk', 'buyuk'],
+                'cluster': 'prov_num',
+                'bootstrap': 'prov_num',
+                'falsification': ['hischshr1520m', 'i89', 'vshr_islam1994',
+                                  'partycount', 'lpop1994', 'merkezi', 'merkezp',
+                                  'subbuyuk', 'buyuk'],
+                'figure16': {'lpop1994': {}, 'partycount': {}, 'vshr_islam1994': {},
+                             'i89': {'x_lim': (-100, 100)}, 'merkezp': {}, 'merkezi': {}},
+                'figure17': ['vshr_islam1994', 'partycount', 'merkezi', 'merkezp',
+                             'subbuyuk', 'buyuk']},
+    'senate': {'source': 'CIT_2020_CUP_senate.csv',
+               'dropna': ['demvoteshfor2'],
+               'derive': {'X': 'demmv', 'Y': 'demvoteshfor2'},
+               'h': 10,
+               'covs': ['presdemvoteshlag1', 'demvoteshlag1', 'demvoteshlag2',
+                        'demwinprv1', 'demwinprv2', 'dmidterm', 'dpresdem', 'dopen'],
+               'cluster': None,
+               'bootstrap': 'state',
+               'falsification': ['presdemvoteshlag1', 'demvoteshlag1',
+                                 'demvoteshlag2', 'demwinprv1', 'demwinprv2',
+                                 'dmidterm', 'dpresdem', 'dopen'],
+               'figure16': {'presdemvoteshlag1': {}, 'demvoteshlag1': {}, 'demvoteshlag2': {},
+                            'demwinprv1': {}, 'demwinprv2': {}, 'dmidterm': {},
+                            'dpresdem': {}, 'dopen': {}},
+               'figure17': ['presdemvoteshlag1', 'demvoteshlag1', 'demvoteshlag2',
+                            'demwinprv1', 'demwinprv2', 'dmidterm', 'dpresdem', 'dopen']},
+}
+
+# Spec keys that determine the loaded data (and so the cache contents)
+_LOAD_KEYS = ('source', 'dropna', 'derive', 'cutoff')
+
+CACHE_DIR = os.environ.get('CIT_DATA_CACHE', '.rdcache/data')
+
+# Bumped when compact_frame's dtype rules change, so compact caches rebuild
+_COMPACT_FORMAT = 2
+
+
+def read_source(path):
+    """Parse a .csv or .dta file into a DataFrame."""
+    if path.lower().endswith('.dta'):
+        return pd.read_stata(path)
+    return pd.read_csv(path)
+
+
+def prepare(data, spec):
+    """Apply a dataset spec's cleaning steps to freshly read data."""
+    if spec.get('dropna'):
+        data = data.dropna(subset = spec['dropna'])
+    for new, old in spec.get('derive', {}).items():
+        data[new] = data[old]
+    if 'X' in spec.get('derive', {}):
+        data['T'] = np.where(data.X >= spec.get('cutoff', 0), 1, 0)
+    return data
+
+
+def _smallest_int(lo, hi):
+    # Signed, so arithmetic on the column (data.T - 1, data.year - 2000)
+    # does not wrap around
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def compact_frame(data, rtol = 0.0, max_categories = 0.5):
+    """Columns of `data` in compact dtypes.
+
+    - integer-valued columns without missing values: the smallest signed
+      integer type holding them (0/1 dummies as int8)
+    - other floats: float32, unless some finite value would move by more
+      than `rtol` relative (by default: unless every value round-trips
+      exactly). The .dta sources store these variables as Stata floats,
+      i.e. float32.
+    - strings with at most `max_categories` * rows distinct values: category
+    """
+    cols = {}
+    for name in data.columns:
+        col = data[name]
+        values = col.to_numpy() if pd.api.types.is_numeric_dtype(col) else None
+        if values is None or values.dtype.kind not in 'fiu':
+            if (values is None and not isinstance(col.dtype, pd.CategoricalDtype)
+                    and col.nunique() <= max_categories * len(col)):
+                col = col.astype('category')
+            cols[name] = col
+            continue
+        finite = values[np.isfinite(values)] if values.dtype.kind == 'f' else values
+        if len(finite) == len(values) and len(values) and np.array_equal(finite, np.round(finite)):
+            cols[name] = values.astype(_smallest_int(finite.min(), finite.max()))
+        elif values.dtype.kind == 'f':
+            with np.errstate(over = 'ignore', invalid = 'ignore'):
+                small = finite.astype(np.float32)
+                back = small.astype(np.float64)
+            lossy = not (np.isfinite(back) & (np.abs(back - finite) <= rtol * np.abs(finite))).all()
+            cols[name] = values if lossy else values.astype(np.float32)
+        else:
+            cols[name] = values
+    return pd.DataFrame(cols, index = data.index)
+
+
+def write_columns(data, path, meta = None):
+    """Write a DataFrame as one .npy file per column plus meta.json.
+
+    The files are written to a temporary directory that is then renamed to
+    `path`, so processes building the same cache at once never see (or
+    remove) each other's partial files.
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok = True)
+    final, path = path, tempfile.mkdtemp(dir = parent, prefix = os.path.basename(path) + '.tmp')
+    columns = []
+    for i, name in enumerate(data.columns):
+        col = data[name]
+        entry = {'name': name, 'file': f'{i}.npy'}
+        if isinstance(col.dtype, pd.CategoricalDtype) or not (
+                pd.api.types.is_numeric_dtype(col) or pd.api.types.is_bool_dtype(col)):
+            entry['kind'] = 'category' if isinstance(col.dtype, pd.CategoricalDtype) else 'string'
+            codes, uniques = pd.factorize(col, sort = True)
+            entry['categories'] = [str(v) for v in uniques]
+            values = codes.astype(np.int32)
+        else:
+            entry['kind'] = 'array'
+            values = col.to_numpy()
+        np.save(os.path.join(path, entry['file']), values, allow_pickle = False)
+        columns.append(entry)
+    index = None
+    if not isinstance(data.index, pd.RangeIndex):
+        index = 'index.npy'
+        np.save(os.path.join(path, index), data.index.to_numpy(), allow_pickle = False)
+    meta = dict(meta or {}, columns = columns, index = index, nrow = len(data))
+    # meta.json is written last: a cache without it is treated as missing
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    _install(path, final)
+    return meta
+
+
+def _install(tmp, path):
+    # Move a finished cache directory into place, replacing any older one.
+    # If another process installs its copy in between, ours is dropped: both
+    # were built from the same source and spec.
+    old = None
+    if os.path.isdir(path):
+        old = tempfile.mkdtemp(dir = os.path.dirname(tmp), prefix = os.path.basename(path) + '.old')
+        try:
+            os.replace(path, os.path.join(old, 'cache'))
+        except FileNotFoundError:
+            pass
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors = True)
+    if old:
+        shutil.rmtree(old, ignore_errors = True)
+
+
+def read_columns(path, meta = None, mmap = True):
+    """Read a directory written by write_columns, memory-mapping numeric columns."""
+    if meta is None:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+    mode = 'r' if mmap else None
+    cols = {}
+    for entry in meta['columns']:
+        values = np.load(os.path.join(path, entry['file']), mmap_mode = mode)
+        if entry['kind'] == 'array':
+            # Plain ndarray view, still backed by the mapped file
+            cols[entry['name']] = values.view(np.ndarray)
+            continue
+        categories = entry['categories']
+        if entry['kind'] == 'category':
+            cols[entry['name']] = pd.Categorical.from_codes(values, categories)
+        else:
+            labels = np.asarray(categories + [None], dtype = object)
+            cols[entry['name']] = labels[values]
+    index = None
+    if meta['index']:
+        index = np.load(os.path.join(path, meta['index']))
+    return pd.DataFrame(cols, index = index, copy = False)
+
+
+def _fresh(meta, source, spec_key):
+    if meta is None or meta.get('spec') != spec_key:
+        return False
+    st = os.stat(source)
+    if meta['size'] == st.st_size and meta['mtime_ns'] == st.st_mtime_ns:
+        return True
+    return meta['sha256'] == file_digest(source)
+
+
+def _cache_path(source, cache_dir = None, compact = False):
+    # One directory per source path: the file name keeps it readable, the
+    # hash of the absolute path tells apart sources with the same name
+    name = f"{os.path.basename(source)}-{digest(os.path.abspath(source))[:12]}"
+    return os.path.join(cache_dir or CACHE_DIR, name + ('.compact' if compact else ''))
+
+
+def load_dataset(name, cache_dir = None, refresh = False, compact = False):
+    """Load a replication dataset, via the columnar cache.
+
+    `name` is a key of DATASETS ('polecon', 'senate') or a path to a .csv or
+    .dta file, which is loaded without cleaning steps. With `compact` the
+    columns are stored in compact dtypes (see compact_frame), cached apart
+    from the full-precision copy.
+    """
+    spec = DATASETS.get(name, {'source': name})
+    source = spec['source']
+    path = _cache_path(source, cache_dir, compact)
+    spec_key = digest({k: spec[k] for k in _LOAD_KEYS if k in spec},
+                      compact and _COMPACT_FORMAT)
+    meta = None
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if not refresh and _fresh(meta, source, spec_key):
+        st = os.stat(source)
+        if meta['mtime_ns'] != st.st_mtime_ns:
+            # Touched but unchanged: record the new stamp to skip rehashing
+            meta.update(size = st.st_size, mtime_ns = st.st_mtime_ns)
+            fd, tmp = tempfile.mkstemp(dir = path, suffix = '.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp, os.path.join(path, 'meta.json'))
+        return read_columns(path, meta)
+    st = os.stat(source)
+    data = prepare(read_source(source), spec)
+    if compact:
+        data = compact_frame(data)
+    meta = write_columns(data, path, {'spec': spec_key, 'sha256': file_digest(source),
+                                      'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+    return read_columns(path, meta)
+
+
+def dataset_hash(name, cache_dir = None):
+    """Hash of a dataset's content: its source file's sha256 and cleaning steps."""
+    spec = DATASETS.get(name, {'source': name})
+    load_dataset(name, cache_dir)
+    path = _cache_path(spec['source'], cache_dir)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    return digest(meta['sha256'], meta['spec'])
@@ -0,0 +1,220 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Validation and falsification of the RD design (Section 5)
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pandas as pd
+from scipy.special import bdtr, comb
+from scipy.stats import norm
+
+from CIT_2020_CUP_cache import rdrobust
+from CIT_2020_CUP_utils import parallel_map
+
+
+def _estimate(task):
+    name, y, x, kwargs = task
+    est = rdrobust(y, x, **kwargs)
+    h_l, h_r = est.bws.loc['h', :].values
+    b_l, b_r = est.bws.loc['b', :].values
+    return {'covariate': name,
+            'coef': est.coef.iloc[0, 0],
+            'se_rb': est.se.iloc[2, 0],
+            'pv_rb': est.pv.iloc[2, 0],
+            'ci_l_rb': est.ci.iloc[2, 0],
+            'ci_r_rb': est.ci.iloc[2, 1],
+            'h_l': h_l, 'h_r': h_r, 'b_l': b_l, 'b_r': b_r,
+            'N_h_l': est.N_h[0], 'N_h_r': est.N_h[1]}
+
+
+def falsification_table(data, covariates, x = 'X', workers = None, **kwargs):
+    """RD effects on predetermined covariates, one rdrobust call per covariate.
+
+    The estimations run on a process pool of `workers` processes (default:
+    all CPUs). Remaining keyword arguments go to rdrobust, e.g.
+    ``bwselect='cerrd'``. Rows follow the order of `covariates`.
+
+    Returns a DataFrame indexed by covariate with the conventional estimate,
+    robust standard error, p-value and confidence interval, bandwidths and
+    effective sample sizes.
+    """
+    tasks = [(name, data[name], data[x], kwargs) for name in covariates]
+    rows = parallel_map(_estimate, tasks, workers = workers)
+    return pd.DataFrame(rows).set_index('covariate')
+
+
+def placebo_scan(y, x, cutoffs, h = None, c = 0, p = 1, kernel = 'triangular',
+                 vce = 'hc0', level = 95):
+    """Fixed-bandwidth RD estimates at many placebo cutoffs (Snippet 33).
+
+    As in Snippet 33, a placebo cutoff above the true cutoff `c` only uses
+    treated observations (x >= c), and one below it only control ones (so
+    the true cutoff itself has no left window and gives NaN). X is sorted
+    once. Cutoffs are grouped by their nearest anchor, a point c + g * h;
+    for each anchor, prefix sums of u**k * y**j with u = (x - anchor) / h
+    are accumulated once over the rows within 2h of it. The window moments
+    of any cutoff t near the anchor are then differences of two prefix sums,
+    shifted from u to (x - t) / h by the binomial expansion, so a cutoff
+    costs O(log n) instead of a pass over its window, and all cutoffs are
+    solved in one batched call. `h` defaults to the MSE-optimal bandwidth
+    (rdbwselect, mserd) at the true cutoff. Windows whose rows all lie
+    within h / 2 of their cutoff are summed directly, as the shifted sums
+    lose precision there.
+
+    Returns a DataFrame indexed by cutoff with the conventional estimate,
+    standard error, p-value, confidence interval and sample sizes.
+    """
+    from CIT_2020_CUP_lpoly import (_fit_moments, _kernel_moments, _kernel_poly,
+                                    _window_moments, kernel_weights)
+
+    y = np.asarray(y, dtype = float)
+    x = np.asarray(x, dtype = float)
+    ok = ~(np.isnan(x) | np.isnan(y))
+    y, x = y[ok], x[ok]
+    if h is None:
+        from CIT_2020_CUP_cache import rdbwselect
+        h = rdbwselect(y, x, c = c, p = p, kernel = kernel, bwselect = 'mserd').bws.iloc[0, 0]
+    order = np.argsort(x, kind = 'stable')
+    xs, ys = x[order], y[order]
+    split = np.searchsorted(xs, c, side = 'left')
+    parts = {False: (xs[:split], ys[:split]), True: (xs[split:], ys[split:])}
+    cutoffs = np.atleast_1d(np.asarray(cutoffs, dtype = float))
+    m = len(cutoffs)
+    degree = 4 * p + 2 * (len(_kernel_poly(kernel)) - 1)
+    k = np.arange(degree + 1)
+    # binom[k, r] = C(k, r), 0 for r > k
+    binom = comb(k[:, None], k[None, :])
+    S = np.zeros((m, 2, degree + 1, 3))
+    n = np.zeros((m, 2), dtype = int)
+    shift = np.zeros((m, 2))
+    above = cutoffs >= c
+    anchor = np.round((cutoffs - c) / h)
+    # Rows of each cutoff's left and right window, within its side of c
+    bounds = np.zeros((m, 2, 2), dtype = int)
+    for part, (px, py) in parts.items():
+        for g in np.unique(anchor[above == part]):
+            a = c + g * h
+            sel = np.flatnonzero((above == part) & (anchor == g))
+            start = np.searchsorted(px, a - 2 * h, side = 'left')
+            stop = np.searchsorted(px, a + 2 * h, side = 'right')
+            # Centering y keeps the expanded residual sums well conditioned
+            ybar = py[start:stop].mean() if stop > start else 0.0
+            shift[sel] = ybar
+            u = (px[start:stop] - a) / h
+            terms = (np.vander(u, degree + 1, increasing = True)[:, :, None]
+                     * np.vander(py[start:stop] - ybar, 3, increasing = True)[:, None, :])
+            P = np.zeros((stop - start + 1, degree + 1, 3))
+            np.cumsum(terms, axis = 0, out = P[1:])
+            t = cutoffs[sel]
+            lo, mid = (np.searchsorted(px, b, side = 'left') - start for b in (t - h, t))
+            hi = np.searchsorted(px, t + h, side = 'right') - start
+            # sum (u - d)**k y**j = sum_r C(k, r) (-d)**(k - r) sum u**r y**j, d = (t - a) / h
+            d = (t - a) / h
+            B = binom * (-d)[:, None, None] ** np.maximum(k[:, None] - k[None, :], 0)
+            for s, (i0, i1) in enumerate(((lo, mid), (mid, hi))):
+                S[sel, s] = np.einsum('ikr,irj->ikj', B, P[i1] - P[i0])
+                n[sel, s] = i1 - i0
+                bounds[sel, s] = np.column_stack([i0, i1]) + start
+    # The left window has v = (x - t) / h = -a, so sums of v**k are (-1)**k times those of a**k
+    S[:, 0] *= ((-1.0) ** k)[:, None]
+    (M1_l, M2_l), (M1_r, M2_r) = (_kernel_moments(S[:, s], sign, kernel, p)
+                                  for s, sign in ((0, -1), (1, 1)))
+    M1, M2 = np.stack([M1_l, M1_r], axis = 1)[..., :2], np.stack([M2_l, M2_r], axis = 1)
+    # A window whose rows all lie within h / 2 of its cutoff (e.g. one cut
+    # short by c) has tiny powers of v, which the binomial shift cannot
+    # resolve; its moments are computed directly from its rows instead
+    rows = bounds + np.where(above, split, 0)[:, None, None]
+    i, s = np.nonzero(n > 0)
+    edge = np.where(s == 0, xs[rows[i, s, 0]], xs[rows[i, s, 1] - 1])
+    thin = np.abs(edge - cutoffs[i]) < h / 2
+    for i, s in zip(i[thin], s[thin]):
+        r0, r1 = rows[i, s]
+        v = (xs[r0:r1] - cutoffs[i]) / h
+        M1[i, s], M2[i, s], shift[i, s] = _window_moments(v, kernel_weights(v, kernel), ys[r0:r1], p)
+    beta, var = _fit_moments(M1, M2, n, p, vce)
+    b0 = beta[..., 0] + shift
+    coef = b0[:, 1] - b0[:, 0]
+    se = np.sqrt(var.sum(axis = 1))
+    z = norm.ppf(0.5 + level / 200)
+    return pd.DataFrame({'coef': coef, 'se': se,
+                         'pv': 2 * norm.sf(np.abs(coef / se)),
+                         'ci_l': coef - z * se, 'ci_r': coef + z * se,
+                         'h': h, 'N_h_l': n[:, 0], 'N_h_r': n[:, 1]},
+                        index = pd.Index(cutoffs, name = 'cutoff'))
+
+
+def donut_scan(y, x, radii, h = None, c = 0, p = 1, kernel = 'triangular',
+               vce = 'hc0', level = 95):
+    """Fixed-bandwidth RD estimates excluding |x - c| < r, for each radius r (Snippet 34).
+
+    The score is sorted once by distance to the cutoff (MomentIndex); each
+    radius then drops the innermost observations by subtracting their prefix
+    sums, so the whole curve costs about as much as one fit. `h` defaults to
+    the MSE-optimal bandwidth (rdbwselect, mserd) of the full sample.
+
+    Returns a DataFrame indexed by radius with the conventional estimate,
+    standard error, p-value, confidence interval and sample sizes.
+    """
+    from CIT_2020_CUP_lpoly import MomentIndex, _kernel_poly
+
+    if h is None:
+        from CIT_2020_CUP_cache import rdbwselect
+        h = rdbwselect(y, x, c = c, p = p, kernel = kernel, bwselect = 'mserd').bws.iloc[0, 0]
+    radii = np.atleast_1d(np.asarray(radii, dtype = float))
+    index = MomentIndex(y, x, c = c, degree = 4 * p + 2 * (len(_kernel_poly(kernel)) - 1))
+    out = index.fit(np.full(len(radii), h), p = p, kernel = kernel, vce = vce,
+                    level = level, donut = radii)
+    return out.drop(columns = ['kernel', 'p', 'donut']).set_index(pd.Index(radii, name = 'donut'))
+
+
+def donut_sensitivity(datasets = ('polecon', 'senate'), radii = np.linspace(0, 5, 51), **kwargs):
+    """donut_scan of the outcome of each replication dataset, stacked by dataset."""
+    from CIT_2020_CUP_data import load_dataset
+
+    frames = {}
+    for name in datasets:
+        data = load_dataset(name)
+        frames[name] = donut_scan(data.Y, data.X, radii, **kwargs)
+    return pd.concat(frames, names = ['dataset'])
+
+
+def binomial_scan(x, windows = None, c = 0, max_windows = 10_000):
+    """Exact binomial tests of treated vs control counts in nested windows (Snippet 31).
+
+    For each symmetric window |x - c| <= w the number of treated (x >= c)
+    and control observations is read off cumulative counts over the sorted
+    |x - c|, and the two-sided p-value of a 50/50 split is computed for all
+    windows at once. `windows` defaults to every distinct distance to the
+    cutoff, i.e. every window that adds observations; with more than
+    `max_windows` of them (None: no limit), to that many evenly spaced by
+    rank, since exact tail probabilities of large counts are the costly part.
+
+    Returns a DataFrame indexed by window with the counts and p-values.
+    """
+    x = np.asarray(x, dtype = float)
+    x = x[~np.isnan(x)]
+    d = np.abs(x - c)
+    order = np.argsort(d)
+    d = d[order]
+    treated = np.zeros(len(d) + 1, dtype = np.int64)
+    np.cumsum(x[order] >= c, out = treated[1:])
+    if windows is None:
+        windows = d[np.append(d[1:] != d[:-1], True)]
+        if max_windows and len(windows) > max_windows:
+            windows = windows[np.linspace(0, len(windows) - 1, max_windows).round().astype(int)]
+    windows = np.atleast_1d(np.asarray(windows, dtype = float))
+    n = np.searchsorted(d, windows, side = 'right')
+    k = treated[n]
+    # Two-sided exact p-value; with p = 1/2 the distribution is symmetric,
+    # so it is twice the smaller tail (as scipy's binomtest)
+    pv = np.minimum(1.0, 2 * bdtr(np.minimum(k, n - k), n, 0.5))
+    return pd.DataFrame({'N_l': n - k, 'N_r': k, 'N': n, 'pv': pv},
+                        index = pd.Index(windows, name = 'window'))
+
+
+def first_rejected_window(scan, alpha = 0.05):
+    """Smallest window of a binomial_scan where balance is rejected at `alpha` (NaN if none)."""
+    rejected = scan.index[scan.pv.to_numpy() < alpha]
+    return rejected.min() if len(rejected) else np.nan
@@ -0,0 +1,159 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Headless batch rendering of the replication figures
+#
+# The binned means and polynomial fits of every rdplot are computed in the
+# main process (rdplot(..., hide = True)); drawing and saving is handed to a
+# process pool using matplotlib's non-interactive Agg backend, so nothing
+# blocks on plt.show().
+#
+# Usage:
+#   python CIT_2020_CUP_figures.py [--out figures] [--format png svg pdf]
+#                                  [--workers N] [polecon] [senate]
+#-----------------------------------------------------------------------------#
+
+import argparse
+import math
+import os
+
+from CIT_2020_CUP_utils import parallel_map
+
+# Axis limits and labels of the polecon script; senate uses the defaults
+_STYLE = {
+    'polecon': {
+        'fig3a': dict(x_label = "Islamic Margin of Victory", y_label = "Female High School Percentage", y_lim = (0, 70)),
+        'fig3b': dict(x_label = "Islamic Margin of Victory", y_label = "Female High School Percentage", y_lim = (0, 70)),
+        'fig6': dict(y_lim = (0, 25)),
+        'fig7a': dict(y_lim = (0, 25)),
+        'fig7b': dict(x_lim = (-100, 100), y_lim = (0, 25)),
+        'fig8': dict(x_lim = (-100, 100), y_lim = (0, 25)),
+        'fig9': dict(x_lim = (-100, 100), y_lim = (0, 25)),
+        'fig11': dict(x_lim = (-100, 100), y_lim = (0, 25)),
+    },
+}
+
+
+_DRAW = ('x_label', 'y_label', 'x_lim', 'y_lim')
+
+
+def _rdplot_task(name, y, x, style, **kwargs):
+    from rdrobust import rdplot
+    style = dict({k: kwargs.pop(k) for k in _DRAW if k in kwargs}, **style)
+    out = rdplot(y, x, hide = True, **kwargs)
+    poly = out.vars_poly
+    half = len(poly) // 2
+    payload = {'bins': out.vars_bins[['rdplot_mean_bin', 'rdplot_mean_y']].to_numpy(),
+               'left': poly.iloc[:half].to_numpy(), 'right': poly.iloc[half:].to_numpy(),
+               'c': out.c}
+    return name, 'rdplot', payload, dict({'x_label': "Score", 'y_label': "Outcome"}, **style)
+
+
+def figure_tasks(dataset):
+    """Data for every figure of a dataset's script, computed in this process."""
+    from CIT_2020_CUP_data import DATASETS, load_dataset
+    from CIT_2020_CUP_cache import rdrobust
+    import rddensity
+
+    data = load_dataset(dataset)
+    style = _STYLE.get(dataset, {})
+    Y, X = data.Y, data.X
+    tasks = []
+
+    def rd(name, y, **kwargs):
+        tasks.append(_rdplot_task(f'{dataset}_{name}', y, X, style.get(name, {}), **kwargs))
+
+    # Section 2
+    rd('fig3a', Y, p = 0, nbins = (2500, 500))
+    rd('fig3b', Y, subset = ((-50 <= X) & (X <= 50)).values, p = 4, nbins = (2500, 500))
+    # Section 3
+    tasks.append((f'{dataset}_fig5', 'scatter', {'x': X.to_numpy(), 'y': Y.to_numpy()}, {}))
+    rd('fig6', Y, nbins = 20, binselect = 'esmv')
+    rd('fig7a', Y, nbins = 20, binselect = 'es')
+    rd('fig7b', Y, nbins = 20, binselect = 'qs')
+    rd('fig8', Y, binselect = 'es')
+    rd('fig9', Y, binselect = 'qs')
+    rd('fig10', Y, binselect = 'esmv')
+    rd('fig11', Y, binselect = 'qsmv')
+    # Section 4: Snippet 19
+    est = rdrobust(Y, X, kernel = 'triangular', p = 1, bwselect = 'mserd')
+    h_l, h_r = est.bws.loc['h', :].values
+    rd('fig15', Y, subset = ((-h_l <= X) & (X <= h_r)).values, p = 1, kernel = 'triangular')
+    # Section 5: Figures 16 and 17
+    for cov, limits in DATASETS[dataset]['figure16'].items():
+        rd(f'fig16_{cov}', data[cov], y_label = "", **limits)
+    for cov in DATASETS[dataset]['figure17']:
+        est = rdrobust(data[cov], X, kernel = 'triangular', p = 1, bwselect = 'mserd')
+        h_l, h_r = est.bws.loc['h', :].values
+        xlim = math.ceil(h_l)
+        rd(f'fig17_{cov}', data[cov], subset = ((-h_l <= X) & (X <= h_r)).values, p = 1,
+           kernel = 'triangular', x_lim = (-xlim, xlim), y_label = "")
+    # Figure 19
+    rdd = rddensity.rddensity(X = X)
+    h_l, h_r = rdd.h.iloc[0], rdd.h.iloc[1]
+    near = X[(X > -h_l) & (X < h_r)].to_numpy()
+    tasks.append((f'{dataset}_fig19a', 'hist', {'left': near[near < 0], 'right': near[near >= 0]},
+                  {'x_label': 'Score', 'y_label': 'Number of observations'}))
+    tasks.append((f'{dataset}_fig19b', 'density', {'rdd': rdd, 'x': X}, {}))
+    return tasks
+
+
+def _render(task):
+    (name, kind, payload, style), outdir, formats = task
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    if kind == 'density':
+        # rdplotdensity builds its own (plotnine) figure
+        import rddensity
+        fig = rddensity.rdplotdensity(payload['rdd'], payload['x']).draw()
+    else:
+        fig, ax = plt.subplots(figsize = (6, 4.5))
+        if kind == 'rdplot':
+            bins = payload['bins']
+            ax.scatter(bins[:, 0], bins[:, 1], s = 8, color = 'darkblue')
+            for side in ('left', 'right'):
+                ax.plot(payload[side][:, 0], payload[side][:, 1], color = 'red')
+            ax.axvline(x = payload['c'], color = 'black', linewidth = 0.5)
+        elif kind == 'scatter':
+            ax.scatter(payload['x'], payload['y'], color = 'black', s = 5)
+            ax.axvline(x = 0, color = 'blue')
+        elif kind == 'hist':
+            ax.hist(payload['left'], bins = 30, color = 'blue', alpha = 0.7)
+            ax.hist(payload['right'], bins = 30, color = 'red', alpha = 0.7)
+            ax.axvline(x = 0, color = 'black', linestyle = '--')
+        ax.set_xlabel(style.get('x_label', ''))
+        ax.set_ylabel(style.get('y_label', ''))
+        if style.get('x_lim'):
+            ax.set_xlim(style['x_lim'])
+        if style.get('y_lim'):
+            ax.set_ylim(style['y_lim'])
+    paths = []
+    for fmt in formats:
+        paths.append(os.path.join(outdir, f'{name}.{fmt}'))
+        fig.savefig(paths[-1])
+    plt.close(fig)
+    return paths
+
+
+def render_figures(datasets = ('polecon', 'senate'), outdir = 'figures',
+                   formats = ('png',), workers = None):
+    """Compute and save every figure of the given datasets; returns file paths."""
+    os.makedirs(outdir, exist_ok = True)
+    tasks = [t for dataset in datasets for t in figure_tasks(dataset)]
+    paths = parallel_map(_render, [(t, outdir, tuple(formats)) for t in tasks],
+                         workers = workers)
+    return [p for group in paths for p in group]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Render the replication figures headlessly.")
+    parser.add_argument('datasets', nargs = '*', default = ['polecon', 'senate'])
+    parser.add_argument('--out', default = 'figures')
+    parser.add_argument('--format', nargs = '+', default = ['png'], choices = ['png', 'svg', 'pdf'])
+    parser.add_argument('--workers', type = int, default = None)
+    args = parser.parse_args()
+    for path in render_figures(args.datasets, args.out, args.format, args.workers):
+        print(path)
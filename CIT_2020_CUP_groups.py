@@ -0,0 +1,159 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Grouped RD estimation: the Snippet 17 specification per state, decade, ...
+#
+# Rather than filtering the data and calling rdrobust once per group, the
+# rows are sorted once by (group, X), so each group's left and right sides are
+# contiguous segments. The kernel-weighted moment sums of every segment come
+# from one segmented reduction (np.add.reduceat), and the local polynomial
+# fits of all groups are solved in one batched call (see lpoly._fit_moments).
+# Per-group bandwidths, when not given, are chosen by rdbwselect (through
+# the result cache) on a process pool, the largest groups first.
+#
+# Usage:
+#   grouped_rd(data, 'state')
+#   grouped_rd(data, data.year // 10 * 10, h = 17.75)
+#   python CIT_2020_CUP_groups.py senate --by state
+#-----------------------------------------------------------------------------#
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+
+from CIT_2020_CUP_utils import parallel_map
+
+
+def _group_keys(data, by):
+    # Group codes (-1 for rows with a missing key) and the frame of distinct keys
+    if isinstance(by, str) or (isinstance(by, list) and all(isinstance(b, str) for b in by)):
+        key = data[np.atleast_1d(by).tolist()]
+    else:
+        key = pd.DataFrame({getattr(by, 'name', None) or 'group': np.asarray(by).reshape(-1)},
+                           index = data.index)
+    groups = key.groupby(list(key.columns), sort = True)
+    return groups.ngroup().fillna(-1).to_numpy(dtype = int), groups.size().index.to_frame(index = False)
+
+
+def _bandwidth(task):
+    # rdbwselect of one group; groups it cannot handle get no bandwidth, and
+    # the error is reported with them
+    from CIT_2020_CUP_cache import rdbwselect
+
+    y, x, c, p, kernel, bwselect = task
+    try:
+        bws = rdbwselect(y, x, c = c, p = p, kernel = kernel, bwselect = bwselect).bws
+    except Exception as exc:
+        return np.nan, np.nan, f'{type(exc).__name__}: {exc}'
+    return bws.iloc[0, 0], bws.iloc[0, 1], None
+
+
+def _segment_sums(terms, seg, n_seg):
+    # Sums of the rows of `terms` over the sorted segment ids 0..n_seg-1
+    out = np.zeros((n_seg,) + terms.shape[1:])
+    if len(seg):
+        starts = np.searchsorted(seg, np.arange(n_seg))
+        filled = starts < np.append(starts[1:], len(seg))
+        out[filled] = np.add.reduceat(terms, starts[filled], axis = 0)
+    return out
+
+
+def grouped_rd(data, by, y = 'Y', x = 'X', c = 0, h = None, p = 1, kernel = 'triangular',
+               vce = 'hc0', level = 95, bwselect = 'mserd', workers = None):
+    """Local polynomial RD estimates for every group of `data` in one pass.
+
+    Parameters
+    ----------
+    data : DataFrame
+    by : str, list of str or array-like
+        Grouping column(s), or a key per row (e.g. data.year // 10 * 10).
+    y, x : str
+        Outcome and score columns.
+    h : float or (float, float), optional
+        Bandwidth of every group; by default each group's own rdbwselect
+        bandwidths (`bwselect`, on `workers` processes).
+    vce : 'hc0' or 'hc1'
+        Heteroskedasticity-robust standard errors of the conventional estimate.
+
+    Returns one row per group with its key, sample sizes, bandwidths, and
+    the estimate, standard error, p-value and confidence interval (NaN when
+    a side of its window has no more than p + 1 observations). With selected
+    bandwidths, `bw_error` says why a group got none (too few observations,
+    or the error rdbwselect raised).
+    """
+    from CIT_2020_CUP_lpoly import _fit_moments, _native, kernel_weights
+
+    codes, keys = _group_keys(data, by)
+    G = len(keys)
+    yv, xv = _native(data[y]).astype(float), _native(data[x]).astype(float)
+    ok = ~(np.isnan(yv) | np.isnan(xv)) & (codes >= 0)
+    yv, xv, codes = yv[ok], xv[ok], codes[ok]
+    order = np.lexsort((xv, codes))
+    yv, xv, codes = yv[order], xv[order], codes[order]
+    right = xv >= c
+    # Segment 2g is the left side of group g, 2g + 1 its right side
+    seg = 2 * codes + right
+    N = np.bincount(seg, minlength = 2 * G).reshape(G, 2)
+    if h is None:
+        # Bandwidth selection dominates the run time: biggest groups first
+        bounds = np.searchsorted(codes, np.arange(G + 1))
+        tasks = [(yv[bounds[g]:bounds[g + 1]], xv[bounds[g]:bounds[g + 1]], c, p, kernel, bwselect)
+                 for g in range(G)]
+        todo = [g for g in np.argsort(-N.sum(axis = 1), kind = 'stable') if (N[g] > p + 1).all()]
+        H = np.full((G, 2), np.nan)
+        errors = np.full(G, f'at most {p + 1} observations on a side', dtype = object)
+        if todo:
+            found = parallel_map(_bandwidth, [tasks[g] for g in todo], workers = workers)
+            H[todo] = [(h_l, h_r) for h_l, h_r, _ in found]
+            errors[todo] = [error for *_, error in found]
+    else:
+        H = np.tile(np.broadcast_to(np.asarray(h, dtype = float), (2,)), (G, 1))
+        errors = np.full(G, None, dtype = object)
+    # Rows in their group's window (left: c - h_l <= x < c, right: c <= x <= c + h_r)
+    hrow = H[codes, right.astype(int)]
+    keep = np.abs(xv - c) <= hrow
+    v = (xv[keep] - c) / hrow[keep]
+    ys, seg = yv[keep], seg[keep]
+    w = kernel_weights(v, kernel)
+    n = np.bincount(seg, minlength = 2 * G)
+    # Centering each segment's y on its mean keeps the residual sums well conditioned
+    ybar = _segment_sums(ys, seg, 2 * G) / np.maximum(n, 1)
+    Yp = np.vander(ys - ybar[seg], 3, increasing = True)
+    V = np.vander(v, 4 * p + 1, increasing = True)
+    M1 = _segment_sums((w[:, None, None] * V[:, :2 * p + 1, None]) * Yp[:, None, :2], seg, 2 * G)
+    M2 = _segment_sums((w[:, None, None] ** 2 * V[:, :, None]) * Yp[:, None, :], seg, 2 * G)
+    beta, var = _fit_moments(M1, M2, n, p, vce)
+    # Small groups are common: a side fitted exactly (n = p + 1) has no
+    # residuals to estimate the variance from, and is left out as well
+    beta[n <= p + 1], var[n <= p + 1] = np.nan, np.nan
+    intercept = (beta[:, 0] + ybar).reshape(G, 2)
+    var, n = var.reshape(G, 2), n.reshape(G, 2)
+    coef = intercept[:, 1] - intercept[:, 0]
+    se = np.sqrt(var.sum(axis = 1))
+    z = ndtri(0.5 + level / 200)
+    return keys.assign(N_l = N[:, 0], N_r = N[:, 1], h_l = H[:, 0], h_r = H[:, 1],
+                       N_h_l = n[:, 0], N_h_r = n[:, 1], coef = coef, se = se,
+                       pv = 2 * ndtr(-np.abs(coef / se)),
+                       ci_l = coef - z * se, ci_r = coef + z * se, bw_error = errors)
+
+
+if __name__ == '__main__':
+    from CIT_2020_CUP_data import load_dataset
+
+    parser = argparse.ArgumentParser(description = "RD estimates per group of a replication dataset.")
+    parser.add_argument('dataset', help = "DATASETS name (polecon, senate) or .csv/.dta path")
+    parser.add_argument('--by', nargs = '+', required = True, help = "grouping column(s)")
+    parser.add_argument('--y', default = 'Y')
+    parser.add_argument('--h', type = float, help = "common bandwidth (default: rdbwselect per group)")
+    parser.add_argument('--p', type = int, default = 1)
+    parser.add_argument('--kernel', default = 'triangular')
+    parser.add_argument('--workers', type = int)
+    args = parser.parse_args()
+    by = args.by[0] if len(args.by) == 1 else args.by
+    table = grouped_rd(load_dataset(args.dataset), by, y = args.y, h = args.h, p = args.p,
+                       kernel = args.kernel, workers = args.workers)
+    pd.set_option('display.width', 160)
+    print(table.to_string(index = False))
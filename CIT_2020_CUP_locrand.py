@@ -0,0 +1,155 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Randomization inference in local-randomization windows
+#
+# The local-randomization approach (rdlocrand's rdrandinf and rdwinselect)
+# treats assignment as random within a small window around the cutoff and
+# compares the observed difference in means with its distribution over
+# permutations of the treatment indicator. Here the permutations of a window
+# are drawn as one B x n matrix and the statistics of every permutation and
+# every covariate come from a single matrix product. Window selection spreads
+# the windows over a process pool, each with its own seed spawned from one
+# SeedSequence, so results do not depend on the number of workers.
+#
+# Usage:
+#   table = rdwinselect(data.X, data[covs], seed = 123)
+#   rdrandinf(data.Y, data.X, recommended_window(table), seed = 123)
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pandas as pd
+
+from CIT_2020_CUP_utils import parallel_map
+
+
+def _diffmeans(T, Z, ok):
+    # Difference in means of each column of Z (n x k) between the treated
+    # and control groups of each assignment in T (B x n), skipping the
+    # missing entries flagged by ok = ~isnan(Z)
+    n1 = T @ ok
+    n0 = ok.sum(axis = 0) - n1
+    s1 = T @ Z
+    s0 = Z.sum(axis = 0) - s1
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return s1 / n1 - s0 / n0
+
+
+def permutation_test(Z, t, reps = 1000, seed = None, chunk = 2**22):
+    """Randomization p-values of the difference in means of each column of Z.
+
+    Parameters
+    ----------
+    Z : array-like (n x k) or (n,)
+        Outcome or covariates of the observations in the window.
+    t : array-like (n,)
+        Treatment indicator.
+    reps : int
+        Number of permutations of t.
+    seed : int, SeedSequence or Generator, optional
+        Seed for the permutations.
+    chunk : int
+        Largest number of permutation-matrix entries drawn at once.
+
+    Returns the observed statistics and the two-sided p-values (arrays of
+    length k): the share of permutations with an absolute statistic at
+    least as large as the observed one, among the permutations whose
+    statistic is defined. The p-value is NaN when the observed statistic is
+    undefined (one group has no non-missing values).
+    """
+    Z = np.asarray(Z, dtype = float)
+    if Z.ndim == 1:
+        Z = Z[:, None]
+    t = np.asarray(t, dtype = float)
+    ok = ~np.isnan(Z)
+    Z = np.where(ok, Z, 0.0)
+    ok = ok.astype(float)
+    obs = _diffmeans(t[None, :], Z, ok)[0]
+    rng = np.random.default_rng(seed)
+    exceed = np.zeros(Z.shape[1])
+    valid = np.zeros(Z.shape[1])
+    step = max(1, chunk // max(len(t), 1))
+    for start in range(0, reps, step):
+        B = min(step, reps - start)
+        T = rng.permuted(np.broadcast_to(t, (B, len(t))), axis = 1)
+        stat = np.abs(_diffmeans(T, Z, ok))
+        finite = np.isfinite(stat)
+        valid += finite.sum(axis = 0)
+        exceed += (finite & (stat >= np.abs(obs) - 1e-12)).sum(axis = 0)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        pv = exceed / valid
+    pv[~np.isfinite(obs)] = np.nan
+    return obs, pv
+
+
+def rdrandinf(y, x, wl, wr = None, c = 0, reps = 1000, seed = None):
+    """Randomization inference for the outcome in the window [c - wl, c + wr].
+
+    Returns a dict with the observed difference in means, its permutation
+    p-value and the number of control and treated observations.
+    """
+    y = np.asarray(y, dtype = float)
+    x = np.asarray(x, dtype = float)
+    wr = wl if wr is None else wr
+    inside = (x >= c - wl) & (x <= c + wr) & ~np.isnan(y)
+    t = x[inside] >= c
+    obs, pv = permutation_test(y[inside], t, reps, seed)
+    return {'statistic': float(obs[0]), 'p_value': float(pv[0]),
+            'N_l': int((~t).sum()), 'N_r': int(t.sum()), 'window': (float(c - wl), float(c + wr))}
+
+
+def _window_task(task):
+    w, Z, t, names, reps, seed = task
+    obs, pv = permutation_test(Z, t, reps, seed)
+    j = np.nanargmin(pv) if np.isfinite(pv).any() else 0
+    return {'window': w, 'N_l': int((~t).sum()), 'N_r': int(t.sum()),
+            'p_value': pv[j], 'variable': names[j], 'statistic': obs[j]}
+
+
+def rdwinselect(x, covs, c = 0, t = None, windows = None, nwindows = 10, wobs = 5,
+                reps = 1000, seed = None, workers = None):
+    """Balance tests of the covariates in nested symmetric windows around c.
+
+    For each window [c - w, c + w] every covariate gets a randomization test
+    of its difference in means; the row reports the smallest p-value and its
+    covariate. `t` is the treatment indicator (default x >= c, e.g. data.T).
+    `windows` defaults to `nwindows` windows, the smallest with 10 observations
+    on each side and each next one adding `wobs` observations per side (as
+    rdlocrand's default). Windows run on a process pool of `workers`
+    processes; window i uses the i-th child of SeedSequence(seed). Without
+    windows (fewer than 10 observations on a side, or `windows` empty) the
+    table is empty.
+    """
+    x = np.asarray(x, dtype = float)
+    if isinstance(covs, pd.Series):
+        covs = covs.to_frame()
+    names = list(map(str, covs.columns)) if isinstance(covs, pd.DataFrame) else \
+        [f"z{j}" for j in range(np.shape(covs)[1])]
+    Z = np.asarray(covs, dtype = float)
+    t = x >= c if t is None else np.asarray(t).astype(bool)
+    keep = ~np.isnan(x)
+    x, Z, t = x[keep], Z[keep], t[keep]
+    if windows is None:
+        dl, dr = np.sort(c - x[x < c]), np.sort(x[x >= c] - c)
+        m = 10 + wobs * np.arange(nwindows)
+        m = m[(m <= len(dl)) & (m <= len(dr))]
+        windows = np.maximum(dl[m - 1], dr[m - 1])
+    windows = np.atleast_1d(np.asarray(windows, dtype = float))
+    seeds = np.random.SeedSequence(seed).spawn(len(windows))
+    tasks = []
+    for w, s in zip(windows, seeds):
+        inside = np.abs(x - c) <= w
+        tasks.append((w, Z[inside], t[inside], names, reps, s))
+    rows = parallel_map(_window_task, tasks, workers = workers)
+    return pd.DataFrame(rows, columns = ['window', 'N_l', 'N_r', 'p_value', 'variable',
+                                         'statistic']).set_index('window')
+
+
+def recommended_window(table, level = 0.15):
+    """Largest window of rdwinselect's table such that it and every smaller
+    window have a minimum p-value of at least `level` (NaN if none). Windows
+    where no covariate could be tested (NaN p-value) do not stop the search."""
+    pv = table.p_value.to_numpy(dtype = float)
+    ok = np.logical_and.accumulate((pv >= level) | np.isnan(pv))
+    return table.index[ok].max() if ok.any() else np.nan
@@ -0,0 +1,581 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Local polynomial RD estimation at a given bandwidth (Section 4)
+#
+# These estimators reproduce the conventional rdrobust point estimate for a
+# fixed bandwidth h (rdrobust(y, x, h = h, p = p, kernel = kernel)) with
+# heteroskedasticity-robust (vce = 'hc0' or 'hc1') or cluster-robust (CR1)
+# standard errors. They do not select bandwidths or bias-correct: use
+# rdbwselect/rdrobust for that.
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import cho_factor, cho_solve
+from scipy.special import ndtr, ndtri
+from scipy.stats import norm
+
+
+def kernel_weights(u, kernel = 'triangular'):
+    """Kernel weights at u = (x - c) / h, zero outside [-1, 1]."""
+    a = np.abs(u)
+    if kernel in ('uniform', 'uni'):
+        return 0.5 * (a <= 1)
+    if kernel in ('epanechnikov', 'epa'):
+        return 0.75 * (1 - a**2) * (a <= 1)
+    if kernel in ('triangular', 'tri'):
+        return (1 - a) * (a <= 1)
+    raise ValueError(f"kernel must be 'uniform', 'triangular' or 'epanechnikov', got {kernel!r}")
+
+
+def _native(a):
+    # Numeric values as an array in their stored dtype (float32, small ints,
+    # bool), so estimators cast only the rows they use to float64
+    a = np.asarray(a)
+    return a if a.dtype.kind in 'fiub' else a.astype(float)
+
+
+def _isnan(a):
+    return np.isnan(a) if a.dtype.kind == 'f' else np.zeros(a.shape, dtype = bool)
+
+
+def _windows(x, c, h_l, h_r):
+    # Left (c - h_l <= x < c) and right (c <= x <= c + h_r) windows. The
+    # bounds are float64 scalars, so a compact score is compared without
+    # being converted as a whole
+    c = np.float64(c)
+    return (x < c) & (x >= c - h_l), (x >= c) & (x <= c + h_r)
+
+
+def _as_outcomes(Y):
+    # Outcome columns in their stored dtypes, and their names
+    if isinstance(Y, pd.DataFrame):
+        return [_native(Y[col]) for col in Y.columns], list(map(str, Y.columns))
+    if isinstance(Y, pd.Series):
+        return [_native(Y)], [str(Y.name)]
+    Y = _native(Y)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    return [Y[:, j] for j in range(Y.shape[1])], [f"y{j}" for j in range(Y.shape[1])]
+
+
+class Clusters:
+    """A cluster variable factorized once into integer codes.
+
+    Cluster-robust variances sum the observation scores within clusters. With
+    the codes computed once, each sum is a bincount over the estimation window,
+    at O(n + G) cost for any number of clusters G. Pass the same instance to
+    every call (outcomes, bandwidths, cutoffs) on the same data. Observations
+    with a missing cluster are dropped, as in rdrobust. `labels` carries the
+    same codes to rdbwselect/rdrobust(..., cluster = clusters.labels), so
+    their bandwidth selection and estimation group integers rather than the
+    raw column.
+    """
+
+    def __init__(self, cluster):
+        if not isinstance(cluster, (pd.Series, pd.Categorical)):
+            # Series (categorical ones included) are factorized as they are
+            cluster = np.asarray(cluster).reshape(-1)
+        codes, uniques = pd.factorize(cluster)
+        self.codes = codes
+        self.n_groups = len(uniques)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def labels(self):
+        """The codes as floats, NaN for a missing cluster (rdrobust's `cluster`)."""
+        return np.where(self.codes >= 0, self.codes, np.nan)
+
+    def sums(self, codes, S):
+        """Within-cluster column sums of S (n x k) and the number of non-empty clusters."""
+        counts = np.bincount(codes, minlength = self.n_groups)
+        sums = np.stack([np.bincount(codes, weights = S[:, j], minlength = self.n_groups)
+                         for j in range(S.shape[1])], axis = 1)
+        return sums[counts > 0], np.count_nonzero(counts)
+
+
+def _as_clusters(cluster):
+    if cluster is None or isinstance(cluster, Clusters):
+        return cluster
+    return Clusters(cluster)
+
+
+def _side_batch(u, w, Y, p, vce, codes = None, clusters = None):
+    # Weighted polynomial fit of every column of Y on one side of the cutoff.
+    # The Gram matrix is factored once; all outcomes share the intercept
+    # influence weights l, so each estimate is a single l @ y product.
+    n = len(u)
+    R = np.vander(u, p + 1, increasing = True)
+    RW = R * w[:, None]
+    chol = cho_factor(R.T @ RW)
+    B = cho_solve(chol, RW.T @ Y)
+    e1 = np.zeros(p + 1)
+    e1[0] = 1
+    l = RW @ cho_solve(chol, e1)
+    E = Y - R @ B
+    if clusters is not None:
+        # CR1, with rdrobust's small-sample factor
+        sums, g = clusters.sums(codes, l[:, None] * E)
+        V = (sums**2).sum(axis = 0)
+        return B, V * ((n - 1) / (n - p - 1)) * (g / (g - 1) if g > 1 else np.nan)
+    V = (l**2) @ (E**2)
+    if vce == 'hc1':
+        V = V * n / (n - p - 1)
+    return B, V
+
+
+def lpoly_batch(Y, x, h, c = 0, p = 1, kernel = 'triangular', vce = 'hc0', level = 95,
+                cluster = None):
+    """Local polynomial RD estimates for many outcomes sharing one score.
+
+    Parameters
+    ----------
+    Y : DataFrame, Series or array (n x k)
+        Outcomes, e.g. ``data[covariates]``.
+    x : array-like
+        Running variable, e.g. ``data.X``.
+    h : float or (float, float)
+        Bandwidth, or (left, right) bandwidths.
+    c, p, kernel :
+        Cutoff, polynomial order and kernel, as in rdrobust.
+    vce : {'hc0', 'hc1'}
+        Heteroskedasticity-robust variance estimator.
+    cluster : array-like or Clusters, optional
+        Cluster variable, for cluster-robust (CR1) standard errors as in
+        rdrobust(..., cluster = cluster, vce = 'cr1'); `vce` is then ignored.
+        With rdrobust's default vce = 'nn', versions before 2.1 use
+        nearest-neighbour cluster residuals instead, which differ.
+
+    Returns a DataFrame indexed by outcome with the estimate, standard error,
+    p-value, confidence interval, left/right intercepts and sample sizes.
+
+    The kernel weights, polynomial design and Gram factorization are built
+    once per side. Outcomes with missing values in the window are grouped by
+    missingness pattern, and each group is solved in one batched call.
+    """
+    cols, names = _as_outcomes(Y)
+    x = _native(x)
+    h_l, h_r = np.broadcast_to(np.asarray(h, dtype = float), (2,))
+    clusters = _as_clusters(cluster)
+    k = len(cols)
+    out = {}
+    for side, hs, keep in zip(('l', 'r'), (h_l, h_r), _windows(x, c, h_l, h_r)):
+        if clusters is not None:
+            keep &= clusters.codes >= 0
+            codes = clusters.codes[keep]
+        u = (x[keep].astype(float) - c) / hs
+        w = kernel_weights(u, kernel)
+        Yw = np.empty((len(u), k))
+        for j, col in enumerate(cols):
+            Yw[:, j] = col[keep]
+        b, v, n = np.full(k, np.nan), np.full(k, np.nan), np.zeros(k, dtype = int)
+        missing = np.isnan(Yw)
+        patterns = {}
+        for j in range(k):
+            patterns.setdefault(missing[:, j].tobytes(), []).append(j)
+        for group in patterns.values():
+            ok = ~missing[:, group[0]]
+            B, V = _side_batch(u[ok], w[ok], Yw[ok][:, group], p, vce,
+                               codes[ok] if clusters is not None else None, clusters)
+            b[group], v[group], n[group] = B[0], V, ok.sum()
+        out[side] = (b, v, n)
+    (b_l, v_l, n_l), (b_r, v_r, n_r) = out['l'], out['r']
+    coef = b_r - b_l
+    se = np.sqrt(v_l + v_r)
+    z = norm.ppf(0.5 + level / 200)
+    return pd.DataFrame({'coef': coef, 'se': se,
+                         'pv': 2 * norm.sf(np.abs(coef / se)),
+                         'ci_l': coef - z * se, 'ci_r': coef + z * se,
+                         'beta0_l': b_l, 'beta0_r': b_r,
+                         'N_h_l': n_l, 'N_h_r': n_r}, index = pd.Index(names, name = 'outcome'))
+
+
+#-------------------------------------------#
+# Estimation from weighted moment sums      #
+#-------------------------------------------#
+# With v = (x - c) / h and kernel weights w, a weighted polynomial fit of y
+# and its HC0 variance depend on the data only through
+#   M1[k, j] = sum(w * v**k * y**j)       k <= 2p,  j = 0, 1
+#   M2[k, j] = sum(w**2 * v**k * y**j)    k <= 4p,  j = 0, 1, 2
+# so any source of these sums (prefix sums, streamed chunks, segmented
+# reductions) yields the same estimates as a direct fit.
+
+# Kernel weights as polynomials in |v| on [0, 1] (constants do not matter)
+_KERNEL_POLY = {'uniform': [1.0], 'uni': [1.0],
+                'triangular': [1.0, -1.0], 'tri': [1.0, -1.0],
+                'epanechnikov': [1.0, 0.0, -1.0], 'epa': [1.0, 0.0, -1.0]}
+
+
+def _kernel_poly(kernel, power = 1):
+    if kernel not in _KERNEL_POLY:
+        raise ValueError(f"kernel must be 'uniform', 'triangular' or 'epanechnikov', got {kernel!r}")
+    return np.polynomial.polynomial.polypow(_KERNEL_POLY[kernel], power)
+
+
+def _fit_moments(M1, M2, n, p, vce = 'hc0'):
+    # Intercept-side fit from moment sums; leading axes of M1/M2/n broadcast.
+    # Returns polynomial coefficients (..., p+1) and the intercept variance.
+    P = p + 1
+    a = np.arange(P)
+    G = M1[..., a[:, None] + a[None, :], 0]
+    rhs = M1[..., :P, 1]
+    n = np.asarray(n)
+    ok = n > p
+    G = np.where(ok[..., None, None], G, np.eye(P))
+    beta = np.linalg.solve(G, rhs[..., None])[..., 0]
+    g = np.linalg.solve(G, np.broadcast_to(np.eye(P)[:, :1], G.shape[:-1] + (1,)))[..., 0]
+    A2 = M2[..., a[:, None] + a, 2]
+    A1 = M2[..., a[:, None, None] + a[:, None] + a, 1]
+    A0 = M2[..., a[:, None, None, None] + a[:, None, None] + a[:, None] + a, 0]
+    V = (np.einsum('...a,...b,...ab->...', g, g, A2)
+         - 2 * np.einsum('...a,...b,...c,...abc->...', g, g, beta, A1)
+         + np.einsum('...a,...b,...c,...d,...abcd->...', g, g, beta, beta, A0))
+    if vce == 'hc1':
+        V = V * n / np.maximum(n - P, 1)
+    beta = np.where(ok[..., None], beta, np.nan)
+    V = np.where(ok, V, np.nan)
+    return beta, V
+
+
+def _window_moments(v, w, y, p):
+    # (M1, M2) of one window computed directly. y is centered on its mean,
+    # which keeps the expanded residual sums well conditioned; the mean is
+    # returned to be added back to the intercept.
+    ybar = y.mean() if len(y) else 0.0
+    V = np.vander(v, 4 * p + 1, increasing = True)
+    Yp = np.vander(y - ybar, 3, increasing = True)
+    M1 = (V[:, :2 * p + 1].T * w) @ Yp[:, :2]
+    M2 = (V.T * w**2) @ Yp
+    return M1, M2, ybar
+
+
+def local_linear(y, x, h, c = 0, kernel = 'triangular', weights = None, vce = 'hc0',
+                 level = 95):
+    """Local linear RD estimate at bandwidth h from one pass of weighted sums.
+
+    The closed-form counterpart of the two-regression Snippets 8 and 11: with
+    `weights` (e.g. Snippet 10's `w`) these replace the kernel weights, and
+    observations with zero weight are left out. Returns a dict with the
+    estimate, its standard error, p-value, confidence interval, the left and
+    right intercepts and the sample sizes, as lpoly_batch for one outcome.
+    """
+    y, x = _native(y), _native(x)
+    h_l, h_r = np.broadcast_to(np.asarray(h, dtype = float), (2,))
+    ok = ~(_isnan(x) | _isnan(y))
+    if weights is not None:
+        weights = _native(weights)
+        ok &= weights > 0
+    out = {}
+    for side, hs, window in zip(('l', 'r'), (h_l, h_r), _windows(x, c, h_l, h_r)):
+        keep = ok & window
+        v = (x[keep].astype(float) - c) / hs
+        w = kernel_weights(v, kernel) if weights is None else weights[keep].astype(float)
+        ys = y[keep].astype(float)
+        M1, M2, ybar = _window_moments(v, w, ys, 1)
+        beta, var = _fit_moments(M1, M2, len(ys), 1, vce)
+        out[side] = (beta[0] + ybar, var, len(ys))
+    (b_l, v_l, n_l), (b_r, v_r, n_r) = out['l'], out['r']
+    coef = b_r - b_l
+    se = np.sqrt(v_l + v_r)
+    # ndtri/ndtr are norm.ppf/norm.cdf without scipy.stats' per-call overhead
+    z = ndtri(0.5 + level / 200)
+    return {'coef': coef, 'se': se, 'pv': 2 * ndtr(-abs(coef / se)),
+            'ci_l': coef - z * se, 'ci_r': coef + z * se,
+            'beta0_l': b_l, 'beta0_r': b_r, 'N_h_l': n_l, 'N_h_r': n_r}
+
+
+def _kernel_moments(S, sign, kernel, p):
+    # (M1, M2) from sums S[..., k, j] of a**k * y**j over one side's window,
+    # a = |x - c| / h: the kernel is a polynomial in a, and v**k = sign**k * a**k
+    K1, K2 = 2 * p, 4 * p
+    k1, k2 = _kernel_poly(kernel, 1), _kernel_poly(kernel, 2)
+    if K2 + len(k2) > S.shape[-2]:
+        raise ValueError(f"p = {p} with kernel {kernel!r} needs degree >= {K2 + len(k2) - 1}")
+    M1 = sum(k1[l] * S[..., l:l + K1 + 1, :] for l in range(len(k1)))
+    M2 = sum(k2[l] * S[..., l:l + K2 + 1, :] for l in range(len(k2)))
+    M1 = M1 * (float(sign) ** np.arange(K1 + 1))[:, None]
+    M2 = M2 * (float(sign) ** np.arange(K2 + 1))[:, None]
+    return M1, M2
+
+
+class MomentIndex:
+    """Sorted-score prefix sums of weighted moments around a cutoff.
+
+    Each side of the cutoff is sorted once by distance to c, and cumulative
+    sums of d**k * y**j are kept for k up to `degree` (enough for p <= 2 with
+    any kernel). The moments of any window |x - c| <= h then cost
+    O(log n) to look up, so estimates for a whole vector of bandwidths come
+    without refitting.
+    """
+
+    def __init__(self, y, x, c = 0, degree = 12):
+        y, x = _native(y), _native(x)
+        ok = ~(_isnan(y) | _isnan(x))
+        y, x = y[ok].astype(float), x[ok].astype(float)
+        self.c = c
+        self.degree = degree
+        # Centering y keeps the expanded residual sums well conditioned
+        self.ybar = y.mean() if len(y) else 0.0
+        self.sides = {}
+        for side, sign, in_side in (('l', -1, x < c), ('r', 1, x >= c)):
+            d = np.abs(x[in_side] - c)
+            order = np.argsort(d, kind = 'stable')
+            d = d[order]
+            ys = y[in_side][order] - self.ybar
+            scale = d[-1] if len(d) and d[-1] > 0 else 1.0
+            u = d / scale
+            powers = u[:, None] ** np.arange(degree + 1)
+            terms = powers[:, :, None] * (ys[:, None] ** np.arange(3))[:, None, :]
+            P = np.zeros((len(d) + 1, degree + 1, 3))
+            np.cumsum(terms, axis = 0, out = P[1:])
+            self.sides[side] = (sign, d, scale, P)
+
+    def moments(self, side, h, kernel = 'triangular', p = 1, donut = 0):
+        """Moment sums (M1, M2, n) for one side over a vector of bandwidths.
+
+        Observations with |x - c| < donut are left out: their prefix sums are
+        subtracted from those of the window.
+        """
+        sign, d, scale, P = self.sides[side]
+        h = np.atleast_1d(np.asarray(h, dtype = float))
+        hi = np.searchsorted(d, h, side = 'right')
+        lo = np.minimum(np.searchsorted(d, np.broadcast_to(donut, h.shape), side = 'left'), hi)
+        S = P[hi] - P[lo]
+        # Rescale sums of u**k to sums of a**k with a = d / h in [0, 1]
+        S = S * ((scale / h)[:, None] ** np.arange(self.degree + 1))[:, :, None]
+        M1, M2 = _kernel_moments(S, sign, kernel, p)
+        return M1, M2, hi - lo
+
+    def fit(self, h, p = 1, kernel = 'triangular', vce = 'hc0', level = 95, donut = 0):
+        """Estimates for each bandwidth in `h` (and donut radius) as a DataFrame (see bandwidth_grid)."""
+        h, donut = np.broadcast_arrays(np.atleast_1d(np.asarray(h, dtype = float)), donut)
+        beta, var, n = {}, {}, {}
+        for side in ('l', 'r'):
+            M1, M2, n[side] = self.moments(side, h, kernel, p, donut)
+            beta[side], var[side] = _fit_moments(M1, M2, n[side], p, vce)
+        coef = beta['r'][:, 0] - beta['l'][:, 0]
+        se = np.sqrt(var['l'] + var['r'])
+        z = norm.ppf(0.5 + level / 200)
+        return pd.DataFrame({'h': h, 'donut': donut, 'kernel': kernel, 'p': p,
+                             'coef': coef, 'se': se,
+                             'pv': 2 * norm.sf(np.abs(coef / se)),
+                             'ci_l': coef - z * se, 'ci_r': coef + z * se,
+                             'N_h_l': n['l'], 'N_h_r': n['r']})
+
+
+def bandwidth_grid(y, x, h, c = 0, p = (1, 2), kernel = ('uniform', 'triangular'),
+                   vce = 'hc0', level = 95):
+    """Bandwidth sensitivity: fixed-h RD estimates over a grid of bandwidths.
+
+    X is sorted once (see MomentIndex); every combination of bandwidth in `h`,
+    polynomial order in `p` and kernel in `kernel` is then estimated from
+    prefix sums. Returns a long DataFrame with one row per combination.
+
+    Example, sweeping around the MSE-optimal bandwidth of Snippet 17:
+        h_mse = est.bws.loc['h', 'left']
+        grid = bandwidth_grid(data.Y, data.X, h_mse * np.linspace(0.5, 2, 31))
+    """
+    kernels, ps = np.atleast_1d(kernel), np.atleast_1d(p)
+    degree = 4 * max(ps) + 2 * max(len(_kernel_poly(k)) - 1 for k in kernels)
+    index = MomentIndex(y, x, c = c, degree = degree)
+    frames = [index.fit(h, p = pp, kernel = kk, vce = vce, level = level)
+              for kk in kernels for pp in ps]
+    return pd.concat(frames, ignore_index = True)
+
+
+class CovariateIndex:
+    """Prefix cross-products for covariate-adjusted fits (Snippets 25-28).
+
+    With covariates Z the RD estimate is the difference of intercepts in the
+    joint weighted fit of y on R(v) * left, R(v) * right and Z, the
+    covariates having one coefficient on both sides (rdrobust's `covs`). The
+    complete-case mask of (y, x, Z) is computed once. Each side is sorted by
+    distance to c once and keeps cumulative sums of a**m * [1, Z, y] and
+    a**m * [Z, y] [Z, y]', a = |x - c| / h. The kernel-weighted Gram matrix
+    and right-hand side of any bandwidth then cost O(log n) to assemble, so a
+    sequence of bandwidths (a grid, or the iterations of a bandwidth search)
+    shares them. Standard errors take one pass over the window's rows, which
+    are a prefix of each sorted side; as in rdrobust, they treat the
+    covariate coefficients as known. Covariates that are collinear within a
+    window (e.g. a dummy that is constant near the cutoff) are dropped from
+    that bandwidth's fit, as rdrobust's covs_drop, and get NaN coefficients.
+
+    `complete` is the complete-case mask, to be passed on as
+    rdbwselect/rdrobust(..., subset = index.complete) so the packages work on
+    the same rows.
+
+    Parameters
+    ----------
+    y, x : array-like
+        Outcome and running variable.
+    covs : DataFrame or array (n x k)
+        Covariates.
+    c : float
+        Cutoff.
+    p : int
+        Highest polynomial order that will be fitted.
+    cluster : array-like or Clusters, optional
+        Cluster variable, for cluster-robust (CR1) standard errors.
+    h_max : float, optional
+        Largest bandwidth that will be fitted. Only rows with |x - c| <= h_max
+        are accumulated, which bounds the memory of the cross-products (a few
+        kB per row with 8 covariates).
+    """
+
+    def __init__(self, y, x, covs, c = 0, p = 2, cluster = None, h_max = None):
+        y, x = _native(y), _native(x)
+        cols, self.names = _as_outcomes(covs)
+        clusters = _as_clusters(cluster)
+        complete = ~(_isnan(y) | _isnan(x))
+        for col in cols:
+            complete &= ~_isnan(col)
+        if clusters is not None:
+            complete &= clusters.codes >= 0
+        self.complete = complete
+        self.c = c
+        self.p = p
+        self.clusters = clusters
+        self.h_max = np.inf if h_max is None else float(h_max)
+        rows = np.flatnonzero(complete)
+        # Centering Z and y keeps the cross-products well conditioned; it
+        # only moves the intercepts, and not their difference
+        G = np.column_stack([col[rows] for col in cols] + [y[rows]]).astype(float)
+        G -= G.mean(axis = 0)
+        x = x[rows].astype(float)
+        # Powers of a up to 2p plus the highest kernel degree (epanechnikov)
+        self.degree = 2 * p + 2
+        self.sides = {}
+        for side, sign, in_side in (('l', -1, x < c), ('r', 1, x >= c)):
+            d = np.abs(x[in_side] - c)
+            order = np.argsort(d, kind = 'stable')
+            order = order[d[order] <= self.h_max]
+            d, Gs = d[order], G[in_side][order]
+            scale = d[-1] if len(d) and d[-1] > 0 else 1.0
+            powers = (d / scale)[:, None] ** np.arange(self.degree + 1)
+            ones = np.column_stack([np.ones(len(d)), Gs])
+            P1 = np.zeros((len(d) + 1, self.degree + 1, ones.shape[1]))
+            np.cumsum(powers[:, :, None] * ones[:, None, :], axis = 0, out = P1[1:])
+            P2 = np.zeros((len(d) + 1, 3, Gs.shape[1], Gs.shape[1]))
+            np.cumsum(powers[:, :3, None, None] * (Gs[:, :, None] * Gs[:, None, :])[:, None],
+                      axis = 0, out = P2[1:])
+            codes = clusters.codes[rows][in_side][order] if clusters is not None else None
+            self.sides[side] = {'sign': sign, 'd': d, 'G': Gs, 'scale': scale,
+                                'P1': P1, 'P2': P2, 'codes': codes}
+
+    def gram(self, h, p = 1, kernel = 'triangular'):
+        """Kernel-weighted Gram matrix A and right-hand side b of the joint fit
+        at bandwidth h (a float or (left, right)), with the window sizes.
+
+        The unknowns are ordered as the left polynomial, the right polynomial
+        and the covariate coefficients.
+        """
+        if p > self.p:
+            raise ValueError(f"cross-products were accumulated for p <= {self.p}")
+        if np.max(h) > self.h_max:
+            raise ValueError(f"cross-products were accumulated for h <= {self.h_max}")
+        kp = _kernel_poly(kernel)
+        P, k = p + 1, len(self.names)
+        A = np.zeros((2 * P + k, 2 * P + k))
+        b = np.zeros(2 * P + k)
+        n = {}
+        m = np.arange(2 * p + 1)
+        for (side, s), hs, block in zip(self.sides.items(), np.broadcast_to(h, (2,)),
+                                        (slice(0, P), slice(P, 2 * P))):
+            hi = np.searchsorted(s['d'], hs, side = 'right')
+            n[side] = hi
+            r = (s['scale'] / hs) ** np.arange(self.degree + 1)
+            S1 = s['P1'][hi] * r[:, None]
+            S2 = s['P2'][hi] * r[:3, None, None]
+            # Sums of w * a**m * [1, Z, y] and of w * [Z, y][Z, y]'
+            T1 = sum(kp[l] * S1[m + l] for l in range(len(kp)))
+            T2 = sum(kp[l] * S2[l] for l in range(len(kp)))
+            signs = float(s['sign']) ** m
+            T1 = T1 * signs[:, None]
+            a = np.arange(P)
+            A[block, block] = T1[a[:, None] + a[None, :], 0]
+            A[block, 2 * P:] = T1[:P, 1:k + 1]
+            A[2 * P:, block] = A[block, 2 * P:].T
+            A[2 * P:, 2 * P:] += T2[:k, :k]
+            b[block] = T1[:P, k + 1]
+            b[2 * P:] += T2[:k, k]
+        return A, b, n
+
+    def _variance(self, h, p, kernel, vce, beta, n):
+        # Per-side variance of the intercept with the joint residuals, as
+        # _side_batch: sum of (l * e)**2, or of its cluster sums
+        P, k = p + 1, len(self.names)
+        kp = _kernel_poly(kernel)
+        gamma = beta[2 * P:]
+        var = 0.0
+        for (side, s), hs, block in zip(self.sides.items(), np.broadcast_to(h, (2,)),
+                                        (slice(0, P), slice(P, 2 * P))):
+            hi = n[side]
+            a = s['d'][:hi] / hs
+            w = np.polynomial.polynomial.polyval(a, kp)
+            R = np.vander(s['sign'] * a, P, increasing = True)
+            RW = R * w[:, None]
+            G = s['G'][:hi]
+            e = G[:, k] - R @ beta[block] - G[:, :k] @ gamma
+            l = RW @ np.linalg.solve(R.T @ RW, np.eye(P)[:, 0])
+            if self.clusters is not None:
+                sums, g = self.clusters.sums(s['codes'][:hi], (l * e)[:, None])
+                V = (sums**2).sum() * ((hi - 1) / (hi - P)) * (g / (g - 1) if g > 1 else np.nan)
+            else:
+                V = (l**2) @ (e**2)
+                if vce == 'hc1':
+                    V = V * hi / (hi - P)
+            var += V
+        return var
+
+    def fit(self, h, p = 1, kernel = 'triangular', vce = 'hc0', level = 95):
+        """Covariate-adjusted estimates for each bandwidth in `h` as a DataFrame
+        (the columns of MomentIndex.fit, and the covariate coefficients).
+
+        Bandwidths whose windows cannot identify the polynomial fit get NaN
+        estimates; `dropped` lists the covariates left out of each fit.
+        """
+        h = np.atleast_1d(np.asarray(h, dtype = float))
+        P, k = p + 1, len(self.names)
+        coef, se, gamma = np.full(len(h), np.nan), np.full(len(h), np.nan), np.full((len(h), k), np.nan)
+        n = {'l': np.zeros(len(h), dtype = int), 'r': np.zeros(len(h), dtype = int)}
+        dropped = [''] * len(h)
+        for i, hs in enumerate(h):
+            A, b, counts = self.gram(hs, p, kernel)
+            for side in n:
+                n[side][i] = counts[side]
+            if min(counts.values()) <= P:
+                continue
+            try:
+                keep = _independent_columns(A, 2 * P)
+                beta = np.zeros(len(b))
+                beta[keep] = np.linalg.solve(A[np.ix_(keep, keep)], b[keep])
+            except np.linalg.LinAlgError:
+                continue
+            used = np.isin(np.arange(2 * P, 2 * P + k), keep)
+            coef[i], gamma[i, used] = beta[P] - beta[0], beta[2 * P:][used]
+            dropped[i] = ' '.join(np.asarray(self.names)[~used])
+            se[i] = np.sqrt(self._variance(hs, p, kernel, vce, beta, counts))
+        z = norm.ppf(0.5 + level / 200)
+        out = pd.DataFrame({'h': h, 'kernel': kernel, 'p': p, 'coef': coef, 'se': se,
+                            'pv': 2 * norm.sf(np.abs(coef / se)),
+                            'ci_l': coef - z * se, 'ci_r': coef + z * se,
+                            'N_h_l': n['l'], 'N_h_r': n['r'], 'dropped': dropped})
+        return pd.concat([out, pd.DataFrame(gamma, columns = self.names)], axis = 1)
+
+
+def _independent_columns(A, fixed, tol = 1e-8):
+    # Indices of a Gram matrix's columns to keep: the first `fixed` ones, then
+    # each later one whose residual after projection on the kept ones is more
+    # than `tol` of its own norm. Raises LinAlgError if the fixed block is
+    # singular.
+    keep = list(range(fixed))
+    cho_factor(A[:fixed, :fixed])
+    for j in range(fixed, len(A)):
+        resid = A[j, j] - A[j, keep] @ np.linalg.solve(A[np.ix_(keep, keep)], A[keep, j])
+        if resid > tol * A[j, j]:
+            keep.append(j)
+    return keep
@@ -0,0 +1,379 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# The replication snippets as a dependency-aware pipeline
+#
+# Each estimation snippet is a named stage with declared inputs (the data,
+# derived columns such as `w`, upstream results such as the Snippet 17
+# bandwidths). Running a stage runs only its dependencies, and a stage whose
+# code, parameters and inputs are unchanged since the last run is loaded from
+# .rdcache/pipeline/ instead of executed.
+#
+# Stages cover Snippets 8-9, 11-17, 19-28 (27-28 with a cluster variable),
+# 32-34, the Section 5 falsification table and the binomial tests in nested
+# windows. Not covered: the RD plots and figures (Snippets 1-7, 18, 30 and
+# the Figures; see CIT_2020_CUP_figures), and Snippets 29 and 31, whose
+# covariate and counts are specific to each script.
+#
+# Usage:
+#   python CIT_2020_CUP_pipeline.py polecon snippet28 snippet34
+#   python CIT_2020_CUP_pipeline.py polecon --list
+#-----------------------------------------------------------------------------#
+
+import contextlib
+import importlib.metadata
+import importlib.util
+import inspect
+import os
+import pickle
+import re
+import sys
+import tempfile
+
+from CIT_2020_CUP_utils import digest, file_digest
+
+
+class Stage:
+    def __init__(self, name, func, inputs, params, fingerprint):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = params
+        self.fingerprint = fingerprint
+
+
+class Pipeline:
+    """Named stages with declared inputs and persisted, fingerprinted outputs.
+
+    A stage's fingerprint hashes its source code, the modules it imports
+    (the files of this repository's modules, followed through their own
+    imports, and the versions of installed packages), its parameters, any
+    external fingerprint (e.g. the hash of a data file) and the fingerprints
+    of its inputs. Stages whose fingerprint matches the stored one are not
+    re-executed.
+    """
+
+    def __init__(self, name, state_dir = '.rdcache/pipeline'):
+        self.name = name
+        self.path = os.path.join(state_dir, name) if state_dir else None
+        self.stages = {}
+        # Stages that do not apply to this pipeline: {name: reason}
+        self.unavailable = {}
+        self.executed = []
+
+    def stage(self, name, inputs = (), params = None, fingerprint = None):
+        """Decorator registering `func(**inputs, **params)` as stage `name`."""
+        def register(func):
+            self.stages[name] = Stage(name, func, inputs, params or {}, fingerprint)
+            return func
+        return register
+
+    def order(self, targets):
+        """Requested stages plus their dependencies, dependencies first."""
+        seen, order = set(), []
+
+        def visit(name, chain):
+            if name in chain:
+                raise ValueError(f"dependency cycle: {' -> '.join(chain + (name,))}")
+            if name in seen:
+                return
+            if name in self.unavailable:
+                raise ValueError(f"{name} {self.unavailable[name]}")
+            if name not in self.stages:
+                raise KeyError(f"unknown stage {name!r}")
+            for dep in self.stages[name].inputs:
+                visit(dep, chain + (name,))
+            seen.add(name)
+            order.append(name)
+
+        for target in targets:
+            visit(target, ())
+        return order
+
+    def fingerprints(self, names):
+        prints = {}
+        for name in names:
+            st = self.stages[name]
+            external = st.fingerprint() if st.fingerprint else None
+            source = inspect.getsource(st.func)
+            prints[name] = digest(name, source, _dependencies(source), st.params,
+                                  external, [prints[d] for d in st.inputs])
+        return prints
+
+    def run(self, targets, force = False):
+        """Run `targets` (names) and their dependencies; returns {name: output}.
+
+        Up-to-date stages are loaded from disk, and only when a stage that
+        does run needs them as input or they were requested.
+        """
+        names = self.order(targets)
+        prints = self.fingerprints(names)
+        stored = self._load_state()
+        outputs = {}
+        self.executed = []
+
+        def get(name):
+            if name in outputs:
+                return outputs[name]
+            st = self.stages[name]
+            if not force and stored.get(name) == prints[name]:
+                try:
+                    with open(self._file(name), 'rb') as f:
+                        outputs[name] = pickle.load(f)
+                    return outputs[name]
+                except (OSError, EOFError, pickle.UnpicklingError, TypeError):
+                    pass
+            args = {dep: get(dep) for dep in st.inputs}
+            outputs[name] = st.func(**args, **st.params)
+            self.executed.append(name)
+            self._save(name, prints[name], outputs[name], stored)
+            return outputs[name]
+
+        return {name: get(name) for name in targets}
+
+    def _file(self, name, ext = '.pkl'):
+        return os.path.join(self.path, name + ext)
+
+    def _load_state(self):
+        # One fingerprint file per stage, so pipelines of the same dataset
+        # running in several processes never overwrite each other's state
+        if not self.path or not os.path.isdir(self.path):
+            return {}
+        stored = {}
+        for entry in os.scandir(self.path):
+            name, ext = os.path.splitext(entry.name)
+            if ext == '.sha256':
+                with open(entry.path) as f:
+                    stored[name] = f.read()
+        return stored
+
+    def _save(self, name, fingerprint, output, stored):
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok = True)
+        stored.pop(name, None)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._file(name, '.sha256'))
+        try:
+            _atomic_write(self._file(name), pickle.dumps(output, protocol = pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Unpicklable outputs (e.g. figures) are simply recomputed
+            return
+        _atomic_write(self._file(name, '.sha256'), fingerprint.encode())
+        stored[name] = fingerprint
+
+
+_IMPORT = re.compile(r'^\s*(?:from\s+(\w+)[\w.]*\s+import\s|import\s+(\w+))', re.MULTILINE)
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _dependencies(source, seen = None):
+    # (module, content hash or version) of everything `source` imports: the
+    # repository's modules by file hash, recursively, other packages by
+    # installed version
+    seen = set() if seen is None else seen
+    deps = []
+    for module in sorted({a or b for a, b in _IMPORT.findall(source)}):
+        if module in seen:
+            continue
+        seen.add(module)
+        spec = importlib.util.find_spec(module)
+        origin = spec.origin if spec else None
+        if origin and os.path.isfile(origin) and os.path.dirname(os.path.abspath(origin)) == _HERE:
+            deps.append((module, file_digest(origin)))
+            with open(origin, encoding = 'utf-8') as f:
+                deps.extend(_dependencies(f.read(), seen))
+        else:
+            try:
+                deps.append((module, importlib.metadata.version(module)))
+            except importlib.metadata.PackageNotFoundError:
+                deps.append((module, None))
+    return deps
+
+
+def _atomic_write(path, data):
+    fd, tmp = tempfile.mkstemp(dir = os.path.dirname(path), suffix = '.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def replication_pipeline(dataset, state_dir = '.rdcache/pipeline', workers = None):
+    """Pipeline of the Section 2-5 estimation snippets for a DATASETS entry.
+
+    `workers` is the process-pool size of the stages that have one (the
+    falsification table); it does not change their results, so it is not
+    part of their fingerprints. Pass 1 when the pipeline itself runs inside a
+    pool worker.
+    """
+    from CIT_2020_CUP_data import DATASETS, load_dataset
+
+    spec = DATASETS[dataset]
+    h = spec['h']
+    covs = spec['covs']
+    cluster = spec.get('cluster')
+    pipe = Pipeline(dataset, state_dir)
+
+    @pipe.stage('data', params = {'dataset': dataset},
+                fingerprint = lambda: file_digest(spec['source']))
+    def data_stage(dataset):
+        return load_dataset(dataset)
+
+    # Python Snippet 10: triangular weights at the hand-picked bandwidth
+    @pipe.stage('w', inputs = ['data'], params = {'h': h})
+    def w_stage(data, h):
+        import numpy as np
+        return np.maximum(1 - np.abs(data['X'] / h), 0)
+
+    # Snippet 8: uniform-weight local linear fit, i.e. two OLS fits
+    @pipe.stage('snippet8', inputs = ['data'], params = {'h': h})
+    def snippet8(data, h):
+        from CIT_2020_CUP_lpoly import local_linear
+        return local_linear(data.Y, data.X, h, kernel = 'uniform')['coef']
+
+    # Snippet 9: one regression of Y on X, T and T * X within h
+    @pipe.stage('snippet9', inputs = ['data'], params = {'h': h})
+    def snippet9(data, h):
+        import numpy as np
+        import pandas as pd
+        import statsmodels.api as sm
+        in_h = (np.abs(data['X']) <= h).to_numpy()
+        X, T, Y = (data[col].to_numpy()[in_h] for col in ('X', 'T', 'Y'))
+        fit = sm.OLS(Y, np.column_stack([np.ones(len(X)), X, T, T * X])).fit()
+        return pd.DataFrame({'coef': fit.params, 'se': fit.bse},
+                            index = ['const', 'X', 'T', 'T_X'])
+
+    # Python Snippet 11: two regressions with the triangular weights `w`
+    @pipe.stage('snippet11', inputs = ['data', 'w'], params = {'h': h})
+    def snippet11(data, w, h):
+        from CIT_2020_CUP_lpoly import local_linear
+        return local_linear(data.Y, data.X, h, weights = w)['coef']
+
+    for snippet, kw in (('snippet12', dict(kernel = 'uniform', p = 1, h = h)),
+                        ('snippet13', dict(kernel = 'triangular', p = 1, h = h)),
+                        ('snippet14', dict(kernel = 'triangular', p = 2, h = h)),
+                        ('snippet17', dict(kernel = 'triangular', p = 1, bwselect = 'mserd')),
+                        ('snippet20', dict(kernel = 'triangular', scaleregul = 0, p = 1, bwselect = 'mserd')),
+                        ('snippet22', dict(kernel = 'triangular', p = 1, bwselect = 'mserd', all = True)),
+                        ('snippet23', dict(kernel = 'triangular', p = 1, bwselect = 'cerrd')),
+                        ('snippet33', dict(c = 1, side = 'right')),
+                        ('snippet34', dict(donut = 0.3))):
+        pipe.stage(snippet, inputs = ['data'], params = {'kw': kw})(_rdrobust_stage)
+
+    for snippet, kw in (('snippet15', dict(kernel = 'triangular', p = 1, bwselect = 'mserd')),
+                        ('snippet16', dict(kernel = 'triangular', p = 1, bwselect = 'msetwo')),
+                        ('snippet24', dict(kernel = 'triangular', p = 1, all = True))):
+        pipe.stage(snippet, inputs = ['data'], params = {'kw': kw})(_rdbwselect_stage)
+
+    # Snippet 17's bandwidths, used by Snippet 19
+    @pipe.stage('bws', inputs = ['snippet17'])
+    def bws_stage(snippet17):
+        return snippet17.bws
+
+    # Snippet 19: rdplot data within the MSE-optimal bandwidth
+    @pipe.stage('snippet19', inputs = ['data', 'bws'])
+    def snippet19(data, bws):
+        from rdrobust import rdplot
+        h_l, h_r = bws.loc['h', :].values
+        subset = ((-h_l <= data.X) & (data.X <= h_r)).values
+        return rdplot(data.Y, data.X, subset = subset, p = 1, kernel = 'triangular', hide = True)
+
+    # Complete-case mask and cross-products of the Snippet 25-28 covariates,
+    # shared by bandwidth selection and estimation
+    @pipe.stage('covindex', inputs = ['data'], params = {'covs': covs})
+    def covindex(data, covs):
+        from CIT_2020_CUP_lpoly import CovariateIndex
+        return CovariateIndex(data.Y, data.X, data[covs], p = 1)
+
+    kw = dict(kernel = 'triangular', scaleregul = 1, p = 1, bwselect = 'mserd')
+    pipe.stage('snippet25', inputs = ['data', 'covindex'],
+               params = {'kw': kw, 'covs': covs})(_rdbwselect_stage)
+    pipe.stage('snippet26', inputs = ['data', 'covindex'],
+               params = {'kw': kw, 'covs': covs})(_rdrobust_stage)
+    if cluster:
+        # The cluster variable factorized once, shared by Snippets 27 and 28
+        @pipe.stage('clusters', inputs = ['data'], params = {'cluster': cluster})
+        def clusters(data, cluster):
+            from CIT_2020_CUP_lpoly import Clusters
+            return Clusters(data[cluster])
+
+        pipe.stage('snippet27', inputs = ['data', 'clusters'],
+                   params = {'kw': kw, 'cluster': cluster})(_rdrobust_stage)
+        pipe.stage('snippet28', inputs = ['data', 'covindex', 'clusters'],
+                   params = {'kw': kw, 'covs': covs, 'cluster': cluster})(_rdrobust_stage)
+    else:
+        for snippet in ('clusters', 'snippet27', 'snippet28'):
+            pipe.unavailable[snippet] = f"needs a cluster variable, which {dataset} does not define"
+
+    # Section 5: covariate falsification (CER-optimal bandwidth)
+    @pipe.stage('falsification', inputs = ['data'],
+                params = {'covariates': spec['falsification']})
+    def falsification(data, covariates):
+        from CIT_2020_CUP_falsification import falsification_table
+        return falsification_table(data, covariates, bwselect = 'cerrd', workers = workers)
+
+    # Binomial tests in every nested window around the cutoff (Snippet 31's
+    # test, over all windows)
+    @pipe.stage('binomial', inputs = ['data'])
+    def binomial(data):
+        from CIT_2020_CUP_falsification import binomial_scan
+        return binomial_scan(data.X)
+
+    # Snippet 32: density test
+    @pipe.stage('snippet32', inputs = ['data'])
+    def snippet32(data):
+        import rddensity
+        return rddensity.rddensity(X = data.X)
+
+    return pipe
+
+
+def _rdrobust_stage(data, kw, covs = None, cluster = None, covindex = None, clusters = None):
+    from CIT_2020_CUP_cache import rdrobust
+    kw = dict(kw)
+    if covindex is not None:
+        kw['subset'] = covindex.complete
+    # Snippet 33 (placebo cutoff on one side) and 34 (donut hole)
+    side = kw.pop('side', None)
+    donut = kw.pop('donut', None)
+    if side is not None:
+        kw['subset'] = (data.X >= 0).values if side == 'right' else (data.X < 0).values
+    if donut is not None:
+        kw['subset'] = (abs(data.X) >= donut).values
+    # `clusters` is the factorized `cluster` column, when a stage has it
+    if clusters is not None:
+        cluster = clusters.labels
+    elif cluster:
+        cluster = data[cluster]
+    return rdrobust(data.Y, data.X, covs = data[covs] if covs else None,
+                    cluster = cluster, **kw)
+
+
+def _rdbwselect_stage(data, kw, covs = None, cluster = None, covindex = None):
+    from CIT_2020_CUP_cache import rdbwselect
+    kw = dict(kw)
+    if covindex is not None:
+        kw['subset'] = covindex.complete
+    return rdbwselect(data.Y, data.X,
+                      covs = data[covs] if covs else None,
+                      cluster = data[cluster] if cluster else None, **kw)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.exit('usage: python CIT_2020_CUP_pipeline.py DATASET (STAGE ... | --list)')
+    pipe = replication_pipeline(sys.argv[1])
+    if sys.argv[2] == '--list':
+        for st in pipe.stages.values():
+            print(st.name, '<-', ', '.join(st.inputs) or '-')
+    else:
+        try:
+            pipe.order(sys.argv[2:])
+        except (KeyError, ValueError) as e:
+            sys.exit(e.args[0])
+        results = pipe.run(sys.argv[2:])
+        for name, out in results.items():
+            print(f'# {name}')
+            print(out)
+        print('# executed:', ', '.join(pipe.executed) or 'none')
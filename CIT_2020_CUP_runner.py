@@ -0,0 +1,162 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Config-driven replication of many datasets on one worker pool
+#
+# The polecon and senate scripts differ only in what DATASETS records: the
+# source file, the derived X/Y/T columns, the hand-picked bandwidth, the
+# covariates and the cluster variable. Further datasets are declared the
+# same way in JSON files. The runner takes the pipeline stages of every
+# dataset (CIT_2020_CUP_pipeline) and schedules them all on a shared process
+# pool: a stage is submitted as soon as the stages it depends on have
+# finished, whatever its dataset, so independent estimates of different
+# datasets run side by side. Stage outputs are stored by the pipelines, and
+# unchanged stages are not re-run.
+#
+# Usage:
+#   python CIT_2020_CUP_runner.py polecon senate
+#   python CIT_2020_CUP_runner.py --spec elections.json --stages snippet17 snippet26
+#-----------------------------------------------------------------------------#
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from CIT_2020_CUP_data import DATASETS, load_dataset
+from CIT_2020_CUP_pipeline import replication_pipeline
+
+
+def load_specs(path):
+    """Register the dataset specs of a JSON file in DATASETS; returns their names.
+
+    The file maps dataset names to specs with the keys of DATASETS, e.g.
+        {"senate1990s": {"source": "senate1990s.csv", "dropna": ["demvoteshfor2"],
+                         "derive": {"X": "demmv", "Y": "demvoteshfor2"},
+                         "h": 10, "covs": ["demvoteshlag1", "dopen"]}}
+    `source` is relative to the JSON file. `cluster` defaults to none,
+    `falsification` to the covariates, `figure16` and `figure17` to the
+    falsification covariates and `bootstrap` to the cluster variable.
+    """
+    with open(path) as f:
+        specs = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for name, spec in specs.items():
+        missing = {'source', 'h', 'covs'} - spec.keys()
+        if missing:
+            raise ValueError(f"{path}: dataset {name!r} lacks {', '.join(sorted(missing))}")
+        spec = dict(spec, source = os.path.relpath(os.path.join(base, spec['source'])))
+        spec.setdefault('cluster', None)
+        spec.setdefault('falsification', list(spec['covs']))
+        spec.setdefault('figure16', {cov: {} for cov in spec['falsification']})
+        spec.setdefault('figure17', list(spec['falsification']))
+        spec.setdefault('bootstrap', spec['cluster'])
+        DATASETS[name] = spec
+    return list(specs)
+
+
+def _run_stage(task):
+    # Stages running in a pool worker get no pool of their own (workers = 1),
+    # or every worker would open one
+    dataset, stage, state_dir, workers = task
+    pipe = replication_pipeline(dataset, state_dir, workers)
+    start = time.perf_counter()
+    pipe.run([stage])
+    return stage in pipe.executed, time.perf_counter() - start
+
+
+def run_datasets(datasets, stages = None, workers = None, state_dir = '.rdcache/pipeline'):
+    """Run the replication pipelines of several datasets on one process pool.
+
+    `stages` are the target stages of every dataset (default: all of them);
+    their dependencies are included, and stages a dataset lacks (Snippets
+    27-28 without a cluster variable) are left out for it. `workers` defaults to the number of CPUs,
+    and 1 runs everything serially in-process. A failing stage does not stop
+    the run: it is reported along with the stages that depend on it, which
+    are skipped.
+
+    Returns one row per (dataset, stage) with its status (run, cached, failed
+    or skipped), wall seconds and error. The outputs themselves are read back
+    with replication_pipeline(dataset).run(stages).
+    """
+    # Build the columnar data caches here, so workers only ever read them
+    for dataset in datasets:
+        load_dataset(dataset)
+    deps = {}
+    for dataset in datasets:
+        pipe = replication_pipeline(dataset, state_dir)
+        targets = [s for s in stages if s in pipe.stages] if stages else list(pipe.stages)
+        for name in pipe.order(targets):
+            deps[dataset, name] = {(dataset, d) for d in pipe.stages[name].inputs}
+    order = list(deps)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    rows = {}
+
+    def record(key, executed = None, seconds = None, error = None):
+        status = 'failed' if error else ('run' if executed else 'cached')
+        rows[key] = {'dataset': key[0], 'stage': key[1], 'status': status,
+                     'seconds': seconds, 'error': error}
+
+    def ready():
+        out = []
+        for key, needs in list(deps.items()):
+            if any(rows.get(d, {}).get('status') in ('failed', 'skipped') for d in needs):
+                del deps[key]
+                rows[key] = {'dataset': key[0], 'stage': key[1], 'status': 'skipped',
+                             'seconds': None, 'error': None}
+            elif all(d in rows for d in needs):
+                del deps[key]
+                out.append(key)
+        return out
+
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        while deps:
+            for key in ready():
+                try:
+                    record(key, *_run_stage((*key, state_dir, None)))
+                except Exception as exc:
+                    record(key, error = f'{type(exc).__name__}: {exc}')
+    else:
+        ctx = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers = workers, mp_context = ctx) as pool:
+            running = {}
+            while deps or running:
+                for key in ready():
+                    running[pool.submit(_run_stage, (*key, state_dir, 1))] = key
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when = FIRST_COMPLETED)
+                for future in finished:
+                    key = running.pop(future)
+                    try:
+                        record(key, *future.result())
+                    except Exception as exc:
+                        record(key, error = f'{type(exc).__name__}: {exc}')
+    return pd.DataFrame([rows[key] for key in order],
+                        columns = ['dataset', 'stage', 'status', 'seconds', 'error'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Run the replication pipelines of several datasets on one process pool.")
+    parser.add_argument('datasets', nargs = '*', help = "dataset names (default: all registered)")
+    parser.add_argument('--spec', nargs = '+', default = [], help = "JSON files of further dataset specs")
+    parser.add_argument('--stages', nargs = '+', help = "target stages (default: all)")
+    parser.add_argument('--workers', type = int)
+    args = parser.parse_args()
+    for path in args.spec:
+        load_specs(path)
+    datasets = args.datasets or list(DATASETS)
+    start = time.perf_counter()
+    table = run_datasets(datasets, args.stages, args.workers)
+    pd.set_option('display.width', 120)
+    print(table.to_string(index = False))
+    print(f"# {len(datasets)} datasets, {(table.status == 'run').sum()} stages run, "
+          f"{(table.status == 'cached').sum()} cached, {time.perf_counter() - start:.1f} s")
+    if (table.status == 'failed').any():
+        raise SystemExit(1)
@@ -13,11 +13,12 @@
 #-----------------------------------------------------------------------------#
 
 # Loading packages
-from rdrobust import rdrobust, rdbwselect, rdplot
-from scipy.stats import binomtest
-from sklearn.linear_model import LinearRegression
+from rdrobust import rdplot
+from CIT_2020_CUP_cache import rdrobust, rdbwselect
+from CIT_2020_CUP_falsification import falsification_table, binomial_scan, first_rejected_window
+from CIT_2020_CUP_data import load_dataset
+from CIT_2020_CUP_lpoly import local_linear, CovariateIndex
 import rddensity
-import pandas as pd
 import matplotlib.pyplot as plt
 import math
 import statsmodels.api as sm
@@ -27,12 +28,8 @@ import numpy as np
 # Loading the data #
 #------------------#
 # Loading the data and defining the main variables
-data = pd.read_csv("CIT_2020_CUP_senate.csv")
-data = data.dropna(subset=['demvoteshfor2'])
-
-data['X'] = data['demmv']
-data['Y'] = data['demvoteshfor2']
-data['T'] = np.where(data.X >= 0, 1, 0)
+# (drops missing demvoteshfor2 and derives X = demmv, Y = demvoteshfor2, T)
+data = load_dataset("senate")
 
 #---------------------#
 # Section 2           #
@@ -98,39 +95,24 @@ print(out)
 #----------------------------------------------#
 # Snippet 8
 # Using two regressions to estimate
-subset_left = data[(data.X < 0) & (data.X >= -10)].copy()
-X_subset_left = subset_left[['X']]
-Y_subset_left = subset_left['Y']
-model_left = LinearRegression().fit(X_subset_left, Y_subset_left)
-left_intercept = model_left.intercept_
-#---#
-subset_right = data[(data.X >= 0) & (data.X <= 10)].copy()
-X_subset_right = subset_right[['X']]
-Y_subset_right = subset_right['Y']
-model_right = LinearRegression().fit(X_subset_right, Y_subset_right)
-right_intercept = model_right.intercept_
+# (the intercepts of the two uniform-weight fits within h = 10, in closed form)
+est = local_linear(data['Y'], data['X'], h = 10, kernel = 'uniform')
+left_intercept = est['beta0_l']
+right_intercept = est['beta0_r']
 #---#
 difference = right_intercept - left_intercept
 print("The RD estimator is:", difference)
 
 # Snippet 9
 # Using one regression to estimate
-data_subset = data[(data['X'] >= -10) & (data['X'] <= 10)]
-T_subset = data_subset['T']
-X_subset = data_subset['X']
-Y_subset = data_subset['Y']
-df = pd.DataFrame({
-    'X': X_subset,
-    'Y': Y_subset,
-    'T': T_subset
-})
-df['T_X'] = df['T'] * df['X']
-X_subset = df.drop(columns=['Y'])
-Y_subset = df['Y']
-X_subset = sm.add_constant(X_subset)
-ols_model = sm.OLS(Y_subset, X_subset)
+in_h = ((data['X'] >= -10) & (data['X'] <= 10)).to_numpy()
+X_subset = data['X'].to_numpy()[in_h]
+T_subset = data['T'].to_numpy()[in_h]
+Y_subset = data['Y'].to_numpy()[in_h]
+design = np.column_stack([np.ones(len(X_subset)), X_subset, T_subset, T_subset * X_subset])
+ols_model = sm.OLS(Y_subset, design)
 ols_results = ols_model.fit()
-print(ols_results.summary())
+print(ols_results.summary(yname = 'Y', xname = ['const', 'X', 'T', 'T_X']))
 
 # Python Snippet 10
 # Generating triangular weights
@@ -139,22 +121,9 @@ data['w'] = np.maximum(data['w'], 0)
 
 # Python Snippet 11
 # Using two regressions and weights to estimate
-subset_left = data[data['X'] < 0].copy()
-subset_right = data[data['X'] >= 0].copy()
-#---#
-X_subset_left = subset_left[['X']]
-Y_subset_left = subset_left['Y']
-weights_left = subset_left['w']
-#---#
-model_left = LinearRegression().fit(X_subset_left, Y_subset_left, sample_weight=weights_left)
-left_intercept = model_left.intercept_
-#---#
-X_subset_right = subset_right[['X']]
-Y_subset_right = subset_right['Y']
-weights_right = subset_right['w']
-#---#
-model_right = LinearRegression().fit(X_subset_right, Y_subset_right, sample_weight=weights_right)
-right_intercept = model_right.intercept_
+est = local_linear(data['Y'], data['X'], h = 10, weights = data['w'])
+left_intercept = est['beta0_l']
+right_intercept = est['beta0_r']
 #---#
 difference = right_intercept - left_intercept
 print("The RD estimator is:", difference)
@@ -234,7 +203,9 @@ print(out)
 # Using rdbwselect with covariates
 Z = data[['presdemvoteshlag1', 'demvoteshlag1', 'demvoteshlag2', 
           'demwinprv1', 'demwinprv2', 'dmidterm', 'dpresdem', 'dopen']]
-out = rdbwselect(data.Y, data.X, covs = Z, kernel = 'triangular', 
+# (complete-case mask and cross-products computed once, see Snippet 26)
+index = CovariateIndex(data.Y, data.X, Z, p = 1)
+out = rdbwselect(data.Y, data.X, covs = Z, subset = index.complete, kernel = 'triangular', 
                  scaleregul = 1, p = 1, bwselect = 'mserd')
 print(out)
 
@@ -242,9 +213,14 @@ print(out)
 # Using rdrobust with covariates
 Z = data[['presdemvoteshlag1', 'demvoteshlag1', 'demvoteshlag2', 
           'demwinprv1', 'demwinprv2', 'dmidterm', 'dpresdem', 'dopen']]
-out = rdrobust(data.Y, data.X, covs = Z, kernel = 'triangular', scaleregul = 1, 
+out = rdrobust(data.Y, data.X, covs = Z, subset = index.complete, kernel = 'triangular', scaleregul = 1, 
                p = 1, bwselect = 'mserd')
 print(out)
+#---#
+# Covariate-adjusted estimates around the MSE-optimal bandwidth, from the
+# cross-products of Snippet 25 (not reported in the text)
+h_mse = out.bws.loc['h', 'left']
+print(index.fit(h_mse * np.linspace(0.5, 1.5, 11), vce = 'hc1').to_string())
 
 #-----------------------------------------------#
 # Section 5                                     #
@@ -267,14 +243,9 @@ out = rdrobust(data.demvoteshlag1, data.X)
 print(out)
 
 # Formal continuity-based analysis for covariates using CER-optimal bandwidth (not reported in the text)
-print(rdrobust(data.presdemvoteshlag1, data.X, bwselect = 'cerrd'))
-print(rdrobust(data.demvoteshlag1, data.X, bwselect = 'cerrd'))
-print(rdrobust(data.demvoteshlag2, data.X, bwselect = 'cerrd'))
-print(rdrobust(data.demwinprv1, data.X, bwselect = 'cerrd'))
-print(rdrobust(data.demwinprv2, data.X, bwselect = 'cerrd'))
-print(rdrobust(data.dmidterm, data.X, bwselect = 'cerrd'))
-print(rdrobust(data.dpresdem, data.X, bwselect = 'cerrd'))
-print(rdrobust(data.dopen, data.X, bwselect = 'cerrd'))
+covs = ['presdemvoteshlag1', 'demvoteshlag1', 'demvoteshlag2', 'demwinprv1',
+        'demwinprv2', 'dmidterm', 'dpresdem', 'dopen']
+print(falsification_table(data, covs, bwselect = 'cerrd').to_string())
 
 # Snippet 30
 # Using rdplot to show the rdrobust effect for demvoteshlag1
@@ -289,9 +260,9 @@ rdplot(y = data.demvoteshlag1, x = data.X, subset = subset, p = 1, kernel = 'tri
 # Graphical illustration of local linear RD effects for predetermined covariates
 Z = data[['presdemvoteshlag1', 'demvoteshlag1', 'demvoteshlag2', 'demwinprv1', 
           'demwinprv2', 'dmidterm', 'dpresdem', 'dopen']]
+est = falsification_table(data, Z.columns, kernel = 'triangular', p = 1, bwselect = 'mserd')
 for i in Z.columns:
-    est = rdrobust(y = Z[i], x = data.X, kernel = 'triangular', p = 1, bwselect = 'mserd')
-    h_l, h_r = est.bws.loc['h', :].values
+    h_l, h_r = est.loc[i, ['h_l', 'h_r']].values
     xlim = math.ceil(h_l)
     subset = ((-h_l <=  data.X) & (data.X <=  h_r)).values
     rdplot(y = Z[i], x = data.X, subset = subset, p = 1, kernel = 'triangular', 
@@ -299,8 +270,13 @@ for i in Z.columns:
 
 # Snippet 31
 # Binomial test
-result = binomtest(52, n = 102, p = 0.5, alternative = 'two-sided')
-print(result.pvalue)
+# (52 control and 50 treated observations with |X| <= 2.1739, counted from the data)
+result = binomial_scan(data.X, windows = [2.1739])
+print(result.pv.iloc[0])
+#---#
+# Binomial tests in every nested window around the cutoff (not reported in the text)
+scan = binomial_scan(data.X)
+print("Smallest window where balance is rejected:", first_rejected_window(scan))
 
 # Snippet 32
 # Using rddensity
@@ -0,0 +1,320 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Warm estimation service on a local socket
+#
+# Dashboards send many small queries against the same data. This asyncio
+# server keeps the datasets loaded and, per outcome, the sorted-score index
+# (MomentIndex) and binning index (BinIndex) in memory. Requests are JSON
+# lines on a Unix socket (or a localhost TCP port). Every request is answered
+# with one JSON line carrying its id, as soon as it is ready, so answers
+# stream back out of order. Fixed-bandwidth estimates that arrive within a
+# few milliseconds of each other are merged: all bandwidths asked for one
+# outcome are fitted from its index in one vectorized call, and clustered
+# requests at one bandwidth are solved for all their outcomes in one
+# lpoly_batch call. Identical rdrobust requests in flight share one run.
+#
+# Requests ("op" and its fields; `dataset` is a DATASETS name or a path):
+#   {"id": 1, "op": "estimate", "dataset": "polecon", "y": "lpop1994", "h": [10, 20],
+#    "p": 1, "kernel": "triangular", "vce": "hc0", "cluster": null}
+#   {"id": 2, "op": "rdrobust", "dataset": "senate", "y": "Y", "covs": true, "kw": {"p": 1}}
+#   {"id": 3, "op": "rdplot", "dataset": "polecon", "y": "lpop1994", "binselect": "qs", "nbins": 20}
+#   {"id": 4, "op": "stats"}
+#
+# Usage:
+#   python CIT_2020_CUP_service.py [--socket .rdcache/service.sock | --port 8765]
+#-----------------------------------------------------------------------------#
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import threading
+
+import numpy as np
+
+_ESTIMATE_COLUMNS = ['outcome', 'h', 'coef', 'se', 'pv', 'ci_l', 'ci_r', 'N_h_l', 'N_h_r']
+
+
+def _records(frame):
+    # JSON-ready rows (numpy scalars to Python, NaN to null)
+    return json.loads(frame.to_json(orient = 'records', double_precision = 15))
+
+
+class EstimationService:
+    """Resident datasets and indices answering estimation and plot requests.
+
+    Parameters
+    ----------
+    window : float
+        Seconds a fixed-bandwidth request waits for others to merge with.
+    compact : bool
+        Keep the datasets in compact dtypes (CIT_2020_CUP_data.compact_frame).
+    """
+
+    def __init__(self, window = 0.002, compact = False):
+        self.window = window
+        self.compact = compact
+        self.stats = collections.Counter()
+        self._data = {}
+        self._indices = {}
+        self._pending = {}
+        self._inflight = {}
+        # Fits run on worker threads: datasets, indices and counters are
+        # created and updated under this lock
+        self._lock = threading.RLock()
+
+    def count(self, name, n = 1):
+        with self._lock:
+            self.stats[name] += n
+
+    def data(self, dataset):
+        with self._lock:
+            if dataset not in self._data:
+                from CIT_2020_CUP_data import load_dataset
+                self._data[dataset] = load_dataset(dataset, compact = self.compact)
+            return self._data[dataset]
+
+    def index(self, kind, dataset, y, x = 'X', c = 0):
+        """The resident MomentIndex ('moments') or BinIndex ('bins') of an outcome."""
+        key = (kind, dataset, y, x, c)
+        with self._lock:
+            if key not in self._indices:
+                data = self.data(dataset)
+                if kind == 'moments':
+                    from CIT_2020_CUP_lpoly import MomentIndex
+                    self._indices[key] = MomentIndex(data[y], data[x], c)
+                else:
+                    from CIT_2020_CUP_binning import BinIndex
+                    self._indices[key] = BinIndex(data[y], data[x], c)
+                self.stats['indices'] += 1
+            return self._indices[key]
+
+    async def handle(self, request):
+        """The response to one request (a dict with its id and result or error)."""
+        self.count('requests')
+        try:
+            op = request.get('op')
+            if op == 'estimate':
+                result = await self.estimate(request)
+            elif op == 'rdrobust':
+                result = await self.rdrobust(request)
+            elif op == 'rdplot':
+                result = await self.rdplot(request)
+            elif op == 'stats':
+                with self._lock:
+                    result = dict(self.stats)
+            else:
+                raise ValueError(f"unknown op {op!r}")
+        except Exception as exc:
+            return {'id': request.get('id'), 'error': f'{type(exc).__name__}: {exc}'}
+        return {'id': request.get('id'), 'result': result}
+
+    async def estimate(self, request):
+        # Join the batch of compatible requests, and wait for its rows
+        outcomes = np.atleast_1d(request.get('y', 'Y')).tolist()
+        hs = np.atleast_1d(np.asarray(request['h'], dtype = float)).tolist()
+        group = (request['dataset'], request.get('x', 'X'), request.get('c', 0),
+                 request.get('p', 1), request.get('kernel', 'triangular'),
+                 request.get('vce', 'hc0'), request.get('level', 95), request.get('cluster'))
+        future = asyncio.get_running_loop().create_future()
+        if group not in self._pending:
+            self._pending[group] = []
+            asyncio.get_running_loop().call_later(self.window, self._run_batch, group)
+        self._pending[group].append((outcomes, hs, future))
+        rows = await future
+        return _records(rows[rows.outcome.isin(outcomes) & rows.h.isin(hs)][_ESTIMATE_COLUMNS])
+
+    def _run_batch(self, group):
+        batch = self._pending.pop(group)
+        loop = asyncio.get_running_loop()
+        self.count('batches')
+        self.count('merged', len(batch) - 1)
+        task = loop.run_in_executor(None, self._fit_batch, group,
+                                    [(outcomes, hs) for outcomes, hs, _ in batch])
+
+        def deliver(task):
+            results = [task.exception()] * len(batch) if task.exception() else task.result()
+            for (*_, future), result in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        task.add_done_callback(deliver)
+
+    def _fit_batch(self, group, requests):
+        # The merged fit of a batch, one result per request. If it fails (one
+        # request naming an unknown column, say), the requests are fitted one
+        # at a time, so only the failing ones get the error.
+        wanted = collections.defaultdict(set)
+        for outcomes, hs in requests:
+            for y in outcomes:
+                wanted[y].update(hs)
+        try:
+            return [self._fit(group, dict(wanted))] * len(requests)
+        except Exception:
+            if len(requests) == 1:
+                raise
+        self.count('unmerged', len(requests))
+        results = []
+        for outcomes, hs in requests:
+            try:
+                results.append(self._fit(group, {y: set(hs) for y in outcomes}))
+            except Exception as exc:
+                results.append(exc)
+        return results
+
+    def _fit(self, group, wanted):
+        # One vectorized fit per outcome (all its bandwidths), or with a
+        # cluster variable one lpoly_batch per bandwidth (all its outcomes)
+        import pandas as pd
+        from CIT_2020_CUP_lpoly import lpoly_batch
+
+        dataset, x, c, p, kernel, vce, level, cluster = group
+        frames = []
+        if cluster is None:
+            for y, hs in wanted.items():
+                fit = self.index('moments', dataset, y, x, c).fit(sorted(hs), p, kernel, vce, level)
+                frames.append(fit.assign(outcome = y))
+        else:
+            data = self.data(dataset)
+            clusters = self._clusters(dataset, cluster)
+            by_h = collections.defaultdict(list)
+            for y, hs in wanted.items():
+                for h in hs:
+                    by_h[h].append(y)
+            for h, ys in by_h.items():
+                fit = lpoly_batch(data[ys], data[x], h, c, p, kernel, vce, level, clusters)
+                frames.append(fit.reset_index().assign(h = h))
+        self.count('fits', len(frames))
+        return pd.concat(frames, ignore_index = True)
+
+    def _clusters(self, dataset, cluster):
+        key = ('clusters', dataset, cluster)
+        with self._lock:
+            if key not in self._indices:
+                from CIT_2020_CUP_lpoly import Clusters
+                self._indices[key] = Clusters(self.data(dataset)[cluster])
+            return self._indices[key]
+
+    async def rdrobust(self, request):
+        # Full rdrobust (bandwidth selection, robust bias correction) on a
+        # worker thread; identical requests in flight share one run
+        from CIT_2020_CUP_data import DATASETS
+
+        dataset = request['dataset']
+        spec = DATASETS.get(dataset, {})
+        covs = request.get('covs')
+        covs = spec.get('covs') if covs is True else covs
+        cluster = request.get('cluster')
+        cluster = spec.get('cluster') if cluster is True else cluster
+        key = json.dumps([dataset, request.get('y', 'Y'), request.get('x', 'X'), covs, cluster,
+                          request.get('kw', {})], sort_keys = True)
+        if key not in self._inflight:
+            loop = asyncio.get_running_loop()
+            self._inflight[key] = loop.run_in_executor(None, self._rdrobust, dataset, request, covs, cluster)
+            self._inflight[key].add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.count('merged')
+        return await asyncio.shield(self._inflight[key])
+
+    def _rdrobust(self, dataset, request, covs, cluster):
+        from CIT_2020_CUP_cache import rdrobust
+        from CIT_2020_CUP_store import _rdrobust_rows
+
+        data = self.data(dataset)
+        est = rdrobust(data[request.get('y', 'Y')], data[request.get('x', 'X')],
+                       covs = data[covs] if covs else None,
+                       cluster = data[cluster] if cluster else None, **request.get('kw', {}))
+        self.count('rdrobust')
+        rows = _rdrobust_rows(est)
+        return {'estimate': rows['estimates'][0] | {'bws': rows['bandwidths'][0]},
+                'coefficients': rows['coefficients']}
+
+    async def rdplot(self, request):
+        # Building the bin index and binning run on a worker thread, like the fits
+        return await asyncio.get_running_loop().run_in_executor(None, self._rdplot, request)
+
+    def _rdplot(self, request):
+        index = self.index('bins', request['dataset'], request.get('y', 'Y'),
+                           request.get('x', 'X'), request.get('c', 0))
+        bins = index.bins(request.get('binselect', 'esmv'), request.get('nbins'),
+                          request.get('scale', 1), request.get('ci', 95))
+        return _records(bins)
+
+    async def serve_client(self, reader, writer):
+        lock = asyncio.Lock()
+
+        async def answer(line):
+            try:
+                request = json.loads(line)
+            except ValueError as exc:
+                response = {'id': None, 'error': f'invalid JSON: {exc}'}
+            else:
+                response = await self.handle(request)
+            async with lock:
+                writer.write(json.dumps(response, default = float).encode() + b'\n')
+                await writer.drain()
+
+        tasks = set()
+        while line := await reader.readline():
+            if line.strip():
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        writer.close()
+
+
+async def serve(socket_path = '.rdcache/service.sock', port = None, preload = (), window = 0.002,
+                compact = False):
+    """Run the service until cancelled, on a Unix socket or a localhost port."""
+    service = EstimationService(window, compact)
+    for dataset in preload:
+        service.data(dataset)
+    if port is not None:
+        server = await asyncio.start_server(service.serve_client, '127.0.0.1', port)
+    else:
+        os.makedirs(os.path.dirname(socket_path) or '.', exist_ok = True)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = await asyncio.start_unix_server(service.serve_client, socket_path)
+    async with server:
+        await server.serve_forever()
+
+
+async def query(requests, socket_path = '.rdcache/service.sock', port = None):
+    """Send requests to a running service; yields the responses as they arrive."""
+    if port is not None:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    else:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    requests = list(requests)
+    for request in requests:
+        writer.write(json.dumps(request).encode() + b'\n')
+    await writer.drain()
+    writer.write_eof()
+    for _ in requests:
+        yield json.loads(await reader.readline())
+    writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Warm RD estimation service on a local socket.")
+    parser.add_argument('--socket', default = '.rdcache/service.sock')
+    parser.add_argument('--port', type = int, help = "listen on 127.0.0.1:PORT instead of a Unix socket")
+    parser.add_argument('--preload', nargs = '*', default = ['polecon', 'senate'])
+    parser.add_argument('--window', type = float, default = 0.002,
+                        help = "seconds a request waits to be merged with others")
+    parser.add_argument('--compact', action = 'store_true',
+                        help = "keep the datasets in compact dtypes (float32, int8, category)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.socket, args.port, args.preload, args.window, args.compact))
+    except KeyboardInterrupt:
+        pass
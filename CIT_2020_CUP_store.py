@@ -0,0 +1,268 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Persistent store of estimation results
+#
+# The store keeps the numbers the replication scripts print: rdrobust
+# estimates, bandwidths (est.bws, or every rdbwselect row), the local
+# polynomial coefficients beta_p_l / beta_p_r and rddensity test results.
+# They sit in a handful of tables, each written as a columnar directory
+# (CIT_2020_CUP_data.write_columns) under .rdcache/store/. A result is keyed by
+# the hash of its dataset and its specification (function, arguments,
+# covariate and cluster columns, package version). Recording a
+# specification that is already stored does no estimation, so a re-run only
+# estimates what changed, and reports can read the tables directly.
+#
+# Usage:
+#   python CIT_2020_CUP_store.py polecon senate
+#   python CIT_2020_CUP_store.py --query estimates --name snippet17
+#-----------------------------------------------------------------------------#
+
+import argparse
+import contextlib
+import errno
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from CIT_2020_CUP_data import read_columns, write_columns
+from CIT_2020_CUP_utils import digest
+
+# Columns of each table; every table has the record key first
+TABLES = {
+    'specs': ['key', 'dataset', 'data_hash', 'name', 'func', 'spec', 'version', 'created'],
+    'estimates': ['key', 'N_l', 'N_r', 'N_h_l', 'N_h_r', 'p', 'q', 'kernel', 'vce', 'bwselect']
+                 + [f'{stat}_{kind}' for kind in ('cl', 'bc', 'rb')
+                    for stat in ('coef', 'se', 'pv', 'ci_l', 'ci_r')],
+    'bandwidths': ['key', 'bwselect', 'h_l', 'h_r', 'b_l', 'b_r'],
+    'coefficients': ['key', 'side', 'order', 'beta'],
+    'density': ['key', 't_jk', 'p_jk', 'h_l', 'h_r', 'N_l', 'N_r', 'N_h_l', 'N_h_r',
+                'f_l', 'f_r'],
+}
+
+_KINDS = {'cl': 'Conventional', 'bc': 'Bias-Corrected', 'rb': 'Robust'}
+
+
+def _rdrobust_rows(est):
+    row = {'N_l': est.N[0], 'N_r': est.N[1], 'N_h_l': est.N_h[0], 'N_h_r': est.N_h[1],
+           'p': est.p, 'q': est.q, 'kernel': est.kernel, 'vce': est.vce,
+           'bwselect': est.bwselect}
+    for kind, label in _KINDS.items():
+        row.update({f'coef_{kind}': est.coef.loc[label].iloc[0],
+                    f'se_{kind}': est.se.loc[label].iloc[0],
+                    f'pv_{kind}': est.pv.loc[label].iloc[0],
+                    f'ci_l_{kind}': est.ci.loc[label].iloc[0],
+                    f'ci_r_{kind}': est.ci.loc[label].iloc[1]})
+    bws = est.bws
+    coefficients = [{'side': side, 'order': j, 'beta': b}
+                    for side, beta in (('l', est.beta_p_l), ('r', est.beta_p_r))
+                    for j, b in enumerate(np.ravel(beta))]
+    return {'estimates': [row],
+            'bandwidths': [{'bwselect': est.bwselect, 'h_l': bws.loc['h', 'left'],
+                            'h_r': bws.loc['h', 'right'], 'b_l': bws.loc['b', 'left'],
+                            'b_r': bws.loc['b', 'right']}],
+            'coefficients': coefficients}
+
+
+def _rdbwselect_rows(bw):
+    return {'bandwidths': [{'bwselect': name, 'h_l': r.iloc[0], 'h_r': r.iloc[1],
+                            'b_l': r.iloc[2], 'b_r': r.iloc[3]}
+                           for name, r in bw.bws.iterrows()]}
+
+
+def _rddensity_rows(dens):
+    return {'density': [{'t_jk': dens.test['t_jk'], 'p_jk': dens.test['p_jk'],
+                         'h_l': dens.h['left'], 'h_r': dens.h['right'],
+                         'N_l': dens.n['left'], 'N_r': dens.n['right'],
+                         'N_h_l': dens.n['eff_left'], 'N_h_r': dens.n['eff_right'],
+                         'f_l': dens.hat['left'], 'f_r': dens.hat['right']}]}
+
+
+class ResultStore:
+    """Estimation results keyed by dataset hash and specification.
+
+    Tables are read lazily and kept in memory; `record` adds to them and
+    `flush` (also run on leaving a `with` block) writes the changed ones.
+    """
+
+    def __init__(self, path = os.environ.get('CIT_STORE_DIR', '.rdcache/store')):
+        self.path = path
+        self._tables = {}
+        self._dirty = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def table(self, name):
+        """A stored table as a DataFrame (empty with its columns if none yet)."""
+        if name not in self._tables:
+            try:
+                frame = read_columns(os.path.join(self.path, name), mmap = False)
+            except (OSError, ValueError):
+                frame = pd.DataFrame(columns = TABLES[name])
+            self._tables[name] = frame
+        return self._tables[name]
+
+    def query(self, table = 'estimates', **filters):
+        """Rows of `table` with their specs, filtered on spec columns, e.g.
+        store.query('bandwidths', dataset = 'senate', name = 'snippet24')."""
+        specs = self.table('specs')
+        for column, value in filters.items():
+            specs = specs[specs[column] == value]
+        if table == 'specs':
+            return specs.reset_index(drop = True)
+        return specs.merge(self.table(table), on = 'key')
+
+    def spec_key(self, dataset, func, kw = None, covs = None, cluster = None,
+                 data_hash = None, y = 'Y', x = 'X'):
+        """Key, specification JSON and package version of a record (see record)."""
+        from importlib.metadata import version as package_version
+        from CIT_2020_CUP_data import dataset_hash
+
+        if data_hash is None:
+            data_hash = dataset_hash(dataset)
+        spec = json.dumps({'func': func, 'kw': kw or {}, 'covs': covs, 'cluster': cluster,
+                           'y': y, 'x': x}, sort_keys = True)
+        version = package_version('rddensity' if func == 'rddensity' else 'rdrobust')
+        return digest(data_hash, spec, version), spec, version
+
+    def record(self, dataset, name, func, kw = None, covs = None, cluster = None,
+               data_hash = None, y = 'Y', x = 'X'):
+        """Estimate and store a specification unless it is already stored.
+
+        `func` is 'rdrobust', 'rdbwselect' or 'rddensity'; `kw` its arguments
+        as in the replication pipeline (with its `side`/`donut` subsets), and
+        `covs`/`cluster` column names and `y`/`x` the outcome and score
+        columns. An earlier result of the same dataset and name with another
+        key (changed data or arguments) is replaced; `name` defaults to a hash
+        of the specification. Returns True when an estimation was run.
+        """
+        from CIT_2020_CUP_data import dataset_hash
+
+        if data_hash is None:
+            data_hash = dataset_hash(dataset)
+        key, spec, version = self.spec_key(dataset, func, kw, covs, cluster, data_hash, y, x)
+        name = name or digest(spec)[:16]
+        specs = self.table('specs')
+        if (specs.key == key).any():
+            return False
+        rows = self._estimate(dataset, func, kw or {}, covs, cluster, y, x)
+        stale = specs.key[(specs.dataset == dataset) & (specs.name == name)].tolist()
+        rows['specs'] = [{'dataset': dataset, 'data_hash': data_hash, 'name': name,
+                          'func': func, 'spec': spec, 'version': version,
+                          'created': time.time()}]
+        for table in TABLES:
+            frame = self.table(table)
+            if stale:
+                frame = frame[~frame.key.isin(stale)]
+            if rows.get(table):
+                new = pd.DataFrame([dict(r, key = key) for r in rows[table]], columns = TABLES[table])
+                frame = new if frame.empty else pd.concat([frame, new], ignore_index = True)
+            elif not stale:
+                continue
+            self._tables[table] = frame.reset_index(drop = True)
+            self._dirty.add(table)
+        return True
+
+    def _estimate(self, dataset, func, kw, covs, cluster, y, x):
+        from CIT_2020_CUP_data import load_dataset
+        from CIT_2020_CUP_pipeline import _rdbwselect_stage, _rdrobust_stage
+
+        data = load_dataset(dataset)
+        if (y, x) != ('Y', 'X'):
+            data = data.assign(**{'Y': data[y], 'X': data[x]})
+        if func == 'rdrobust':
+            return _rdrobust_rows(_rdrobust_stage(data, kw, covs, cluster))
+        if func == 'rdbwselect':
+            return _rdbwselect_rows(_rdbwselect_stage(data, kw, covs, cluster))
+        if func == 'rddensity':
+            import rddensity
+            return _rddensity_rows(rddensity.rddensity(X = data.X, **kw))
+        raise ValueError(f"unknown function {func!r}")
+
+    def flush(self):
+        """Write the changed tables (each replaced as a whole directory).
+
+        Concurrent writers never leave a table half-written, and the last one
+        to flush a table wins: records the others added to it are dropped and
+        estimated again when next needed.
+        """
+        os.makedirs(self.path, exist_ok = True)
+        for name in sorted(self._dirty):
+            path = os.path.join(self.path, name)
+            new = tempfile.mkdtemp(dir = self.path, prefix = name + '.new.')
+            write_columns(self._tables[name], new)
+            # Displaced tables go to a private directory, removed once ours is in
+            trash = tempfile.mkdtemp(dir = self.path, prefix = name + '.old.')
+            for attempt in itertools.count():
+                with contextlib.suppress(FileNotFoundError):
+                    os.rename(path, os.path.join(trash, str(attempt)))
+                try:
+                    os.rename(new, path)
+                    break
+                except OSError as e:
+                    # Another writer installed its table in between: displace it too
+                    if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                        raise
+            shutil.rmtree(trash, ignore_errors = True)
+        self._dirty = set()
+
+
+def record_replication(dataset, store = None, names = None):
+    """Store the estimates, bandwidth choices and density test of a dataset's
+    replication pipeline (its rdrobust, rdbwselect and Snippet 32 stages).
+
+    Returns the names of the specifications that were estimated; the others
+    were already stored for the current data.
+    """
+    from CIT_2020_CUP_data import dataset_hash
+    from CIT_2020_CUP_pipeline import (_rdbwselect_stage, _rdrobust_stage,
+                                       replication_pipeline)
+
+    store = store or ResultStore()
+    pipe = replication_pipeline(dataset, state_dir = None)
+    data_hash = dataset_hash(dataset)
+    funcs = {_rdrobust_stage: 'rdrobust', _rdbwselect_stage: 'rdbwselect'}
+    estimated = []
+    for st in pipe.stages.values():
+        if names and st.name not in names:
+            continue
+        if st.func in funcs:
+            func, params = funcs[st.func], st.params
+        elif st.name == 'snippet32':
+            func, params = 'rddensity', {}
+        else:
+            continue
+        if store.record(dataset, st.name, func, data_hash = data_hash, **params):
+            estimated.append(st.name)
+    store.flush()
+    return estimated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Store the replication estimates, or query the store.")
+    parser.add_argument('datasets', nargs = '*', default = ['polecon', 'senate'])
+    parser.add_argument('--names', nargs = '+', help = "specifications (pipeline stage names) to record")
+    parser.add_argument('--query', choices = list(TABLES), help = "print a stored table instead")
+    parser.add_argument('--name', help = "with --query, only this specification")
+    args = parser.parse_args()
+    store = ResultStore()
+    pd.set_option('display.width', 160)
+    if args.query:
+        filters = {'name': args.name} if args.name else {}
+        rows = pd.concat([store.query(args.query, dataset = d, **filters) for d in args.datasets])
+        print(rows.drop(columns = ['key', 'data_hash', 'spec', 'version', 'created']).to_string(index = False))
+    else:
+        for dataset in args.datasets:
+            estimated = record_replication(dataset, store, args.names)
+            print(f"{dataset}: estimated {', '.join(estimated) or 'nothing'}")
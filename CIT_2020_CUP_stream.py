@@ -0,0 +1,148 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Out-of-core local polynomial RD estimation
+#
+# For data too large to load, the source is read in chunks of (score,
+# outcome) pairs. Each chunk only adds its in-window observations to moment
+# sums of |x - c| / h and y, per side and candidate bandwidth. Peak memory is
+# one chunk plus the sums, whatever the file size. The fixed-bandwidth
+# estimates (Snippets 11-14: uniform or triangular kernel, p = 1 or 2) then
+# follow from the sums exactly as in CIT_2020_CUP_lpoly.
+#
+# Usage:
+#   python CIT_2020_CUP_stream.py CIT_2020_CUP_senate.csv --x demmv --y demvoteshfor2 --h 10 17.7
+#-----------------------------------------------------------------------------#
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from CIT_2020_CUP_lpoly import _fit_moments, _kernel_moments, _kernel_poly
+
+
+class StreamingMoments:
+    """Moment sums of a local polynomial fit, updated chunk by chunk.
+
+    Parameters
+    ----------
+    h : float or sequence of float
+        Candidate bandwidths; only observations with |x - c| <= max(h) are used.
+    c : float
+        Cutoff.
+    p : int
+        Highest polynomial order that will be fitted.
+    kernel : str or sequence of str
+        Kernels that will be fitted (they fix the number of moments kept).
+    """
+
+    def __init__(self, h, c = 0, p = 2, kernel = ('uniform', 'triangular')):
+        self.h = np.atleast_1d(np.asarray(h, dtype = float))
+        self.c = c
+        self.p = p
+        self.degree = 4 * p + 2 * max(len(_kernel_poly(k)) - 1 for k in np.atleast_1d(kernel))
+        # S[side][i, k, j] = sum of a**k * (y - shift)**j with a = |x - c| / h[i] <= 1
+        self.S = {side: np.zeros((len(self.h), self.degree + 1, 3)) for side in ('l', 'r')}
+        self.shift = None
+        self.rows = 0
+
+    def update(self, y, x):
+        """Add a chunk of outcomes and scores (pairs with a missing value are skipped)."""
+        y = np.asarray(y, dtype = float)
+        x = np.asarray(x, dtype = float)
+        self.rows += len(x)
+        d = x - self.c
+        near = (np.abs(d) <= self.h.max()) & ~np.isnan(y)
+        d, y = d[near], y[near]
+        if self.shift is None and len(y):
+            # A fixed shift near the outcome mean keeps the sums well conditioned
+            self.shift = y.mean()
+        y = y - (self.shift or 0.0)
+        for side, in_side in (('l', d < 0), ('r', d >= 0)):
+            a, ys = np.abs(d[in_side]), y[in_side]
+            Yp = np.vander(ys, 3, increasing = True)
+            for i, h in enumerate(self.h):
+                keep = a <= h
+                A = np.vander(a[keep] / h, self.degree + 1, increasing = True)
+                self.S[side][i] += A.T @ Yp[keep]
+        return self
+
+    def fit(self, p = 1, kernel = 'triangular', vce = 'hc0', level = 95):
+        """Estimates for every candidate bandwidth, as MomentIndex.fit."""
+        if p > self.p:
+            raise ValueError(f"moments were accumulated for p <= {self.p}")
+        beta, var, n = {}, {}, {}
+        for side, sign in (('l', -1), ('r', 1)):
+            S = self.S[side]
+            M1, M2 = _kernel_moments(S, sign, kernel, p)
+            n[side] = S[:, 0, 0].astype(int)
+            beta[side], var[side] = _fit_moments(M1, M2, n[side], p, vce)
+        coef = beta['r'][:, 0] - beta['l'][:, 0]
+        se = np.sqrt(var['l'] + var['r'])
+        z = norm.ppf(0.5 + level / 200)
+        return pd.DataFrame({'h': self.h, 'kernel': kernel, 'p': p,
+                             'coef': coef, 'se': se,
+                             'pv': 2 * norm.sf(np.abs(coef / se)),
+                             'ci_l': coef - z * se, 'ci_r': coef + z * se,
+                             'N_h_l': n['l'], 'N_h_r': n['r']})
+
+
+def read_chunks(source, x = 'X', y = 'Y', chunksize = 1_000_000):
+    """Yield (y, x) array chunks from a .csv, a .dta or a columnar cache directory.
+
+    A directory is one written by CIT_2020_CUP_data.write_columns; its columns
+    are memory-mapped and read a slice at a time.
+    """
+    if os.path.isdir(source):
+        from CIT_2020_CUP_data import read_columns
+        data = read_columns(source)
+        Y, X = data[y].to_numpy(), data[x].to_numpy()
+        for start in range(0, len(X), chunksize):
+            yield Y[start:start + chunksize], X[start:start + chunksize]
+        return
+    if source.lower().endswith('.dta'):
+        reader = pd.read_stata(source, columns = [x, y], chunksize = chunksize)
+    else:
+        reader = pd.read_csv(source, usecols = [x, y], chunksize = chunksize)
+    with reader:
+        for chunk in reader:
+            yield chunk[y].to_numpy(dtype = float), chunk[x].to_numpy(dtype = float)
+
+
+def stream_estimate(source, h, x = 'X', y = 'Y', c = 0, p = (1, 2),
+                    kernel = ('uniform', 'triangular'), vce = 'hc0', level = 95,
+                    chunksize = 1_000_000):
+    """Fixed-bandwidth RD estimates from a file read in chunks.
+
+    Returns one row per combination of bandwidth, kernel and order, with the
+    columns of bandwidth_grid. For the senate data, where the score and
+    outcome are demmv and demvoteshfor2:
+        stream_estimate('CIT_2020_CUP_senate.csv', 10, x = 'demmv', y = 'demvoteshfor2')
+    """
+    kernels, ps = np.atleast_1d(kernel), np.atleast_1d(p)
+    acc = StreamingMoments(h, c = c, p = int(max(ps)), kernel = kernels)
+    for ys, xs in read_chunks(source, x, y, chunksize):
+        acc.update(ys, xs)
+    frames = [acc.fit(p = int(pp), kernel = kk, vce = vce, level = level)
+              for kk in kernels for pp in ps]
+    return pd.concat(frames, ignore_index = True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Fixed-bandwidth RD estimates from a file read in chunks.")
+    parser.add_argument('source')
+    parser.add_argument('--x', default = 'X')
+    parser.add_argument('--y', default = 'Y')
+    parser.add_argument('--h', nargs = '+', type = float, required = True)
+    parser.add_argument('--c', type = float, default = 0)
+    parser.add_argument('--p', nargs = '+', type = int, default = [1, 2])
+    parser.add_argument('--kernel', nargs = '+', default = ['uniform', 'triangular'])
+    parser.add_argument('--chunksize', type = int, default = 1_000_000)
+    args = parser.parse_args()
+    pd.set_option('display.width', 120)
+    print(stream_estimate(args.source, args.h, args.x, args.y, args.c, args.p,
+                          args.kernel, chunksize = args.chunksize).to_string(index = False))
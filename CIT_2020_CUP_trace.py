@@ -0,0 +1,297 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Instrumentation of a replication run
+#
+# Wraps the loading, estimation, bandwidth selection, variance and plotting
+# functions used by the replication scripts and records, per call, wall and
+# CPU time and (optionally) traced allocations. Each call is attributed to
+# the nearest "# Snippet ..." / "# Figure ..." comment above the script line
+# that made it. Results are written as a Chrome trace (chrome://tracing,
+# Perfetto) with a per-stage summary. With CIT_PROFILE_SAMPLE=<ms> a sampling
+# profiler also records the main thread's stack every <ms> milliseconds, as
+# collapsed stacks (<out>.samples.txt, for flamegraph tools). Nothing is
+# wrapped or sampled unless a run is traced.
+#
+# Usage:
+#   python CIT_2020_CUP_trace.py --out trace.json CIT_2020_CUP_polecon.py
+#   CIT_PROFILE_SAMPLE=5 python CIT_2020_CUP_trace.py CIT_2020_CUP_senate.py
+#-----------------------------------------------------------------------------#
+
+import argparse
+import collections
+import contextlib
+import functools
+import importlib
+import json
+import linecache
+import os
+import re
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
+
+# (module, attribute, category) of every instrumented function
+_TARGETS = (
+    ('pandas', 'read_csv', 'io'),
+    ('pandas', 'read_stata', 'io'),
+    ('CIT_2020_CUP_data', 'load_dataset', 'io'),
+    ('CIT_2020_CUP_cache', 'rdrobust', 'estimation'),
+    ('CIT_2020_CUP_cache', 'rdbwselect', 'bandwidth'),
+    ('CIT_2020_CUP_falsification', 'falsification_table', 'estimation'),
+    ('rdrobust', 'rdrobust', 'estimation'),
+    ('rdrobust', 'rdbwselect', 'bandwidth'),
+    ('rdrobust', 'rdplot', 'plot'),
+    ('rdrobust.rdrobust', 'rdrobust_bw', 'bandwidth'),
+    ('rdrobust.rdrobust', 'rdrobust_res', 'variance'),
+    ('rdrobust.rdrobust', 'rdrobust_vce', 'variance'),
+    ('rdrobust.rdbwselect', 'rdrobust_bw', 'bandwidth'),
+    ('rddensity', 'rddensity', 'estimation'),
+    ('rddensity', 'rdplotdensity', 'plot'),
+    ('statsmodels.api', 'OLS.fit', 'estimation'),
+    ('matplotlib.pyplot', 'show', 'plot'),
+    ('matplotlib.pyplot', 'savefig', 'plot'),
+)
+
+_LABEL = re.compile(r'#\s*((?:Python )?Snippet \d+|Figure \d+\w*|Table \d+)')
+
+_active = None
+
+
+class Tracer:
+    """Timed spans collected as Chrome trace events.
+
+    Parameters
+    ----------
+    scripts : iterable of str
+        Paths of the scripts whose lines calls are attributed to.
+    memory : bool
+        Record allocated and peak traced memory per span (with tracemalloc,
+        which slows the run down noticeably).
+    """
+
+    def __init__(self, scripts = (), memory = True):
+        self.scripts = {os.path.abspath(s) for s in scripts}
+        self.memory = memory
+        self.events = []
+        self.start = time.perf_counter_ns()
+        self._stack = []
+        self._labels = {}
+        self._patched = []
+
+    @contextlib.contextmanager
+    def span(self, name, cat = 'stage', site = None):
+        """Context manager timing a block as one trace event."""
+        frame = {'peak': 0}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['mem0'] = current
+        self._stack.append(frame)
+        cpu0 = time.process_time()
+        t0 = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            t1 = time.perf_counter_ns()
+            cpu1 = time.process_time()
+            self._stack.pop()
+            args = {'cpu_ms': (cpu1 - cpu0) * 1e3}
+            if site:
+                args['site'] = site
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(frame['peak'], peak)
+                args['alloc_kb'] = (current - frame['mem0']) / 1024
+                args['peak_kb'] = (peak - frame['mem0']) / 1024
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            self.events.append({'name': name, 'cat': cat, 'ph': 'X',
+                                'ts': (t0 - self.start) / 1e3, 'dur': (t1 - t0) / 1e3,
+                                'pid': os.getpid(), 'tid': threading.get_ident(),
+                                'args': args})
+
+    def site(self):
+        """Label of the traced-script line currently executing, if any."""
+        frame = sys._getframe(2)
+        while frame is not None:
+            path = frame.f_code.co_filename
+            if path in self.scripts:
+                return self._label(path, frame.f_lineno)
+            frame = frame.f_back
+        return None
+
+    def _label(self, path, lineno):
+        key = (path, lineno)
+        if key not in self._labels:
+            label = f'line {lineno}'
+            for i in range(lineno, 0, -1):
+                match = _LABEL.match(linecache.getline(path, i))
+                if match:
+                    label = match.group(1)
+                    break
+            self._labels[key] = label
+        return self._labels[key]
+
+    def wrap(self, func, name, cat):
+        """`func` timed as a span named `name` on every call."""
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            with self.span(name, cat, self.site()):
+                return func(*args, **kwargs)
+        traced.__traced__ = func
+        return traced
+
+    def install(self, targets = _TARGETS):
+        """Replace the target functions by traced versions (see uninstall).
+
+        Targets that cannot be resolved (module not installed, or no such
+        function in the installed version) are reported with a warning.
+        """
+        for module, attr, cat in targets:
+            try:
+                owner = importlib.import_module(module)
+                *path, name = attr.split('.')
+                for part in path:
+                    owner = getattr(owner, part)
+                func = getattr(owner, name)
+            except (ImportError, AttributeError) as exc:
+                warnings.warn(f"not tracing {module}.{attr}: {exc}", stacklevel = 2)
+                continue
+            if hasattr(func, '__traced__'):
+                continue
+            # Methods may be inherited: remember whether the owner defined it
+            own = name in getattr(owner, '__dict__', {})
+            setattr(owner, name, self.wrap(func, attr, cat))
+            self._patched.append((owner, name, func, own))
+
+    def uninstall(self):
+        for owner, name, func, own in reversed(self._patched):
+            if own:
+                setattr(owner, name, func)
+            else:
+                delattr(owner, name)
+        self._patched = []
+
+    def summary(self):
+        """Calls, inclusive wall/CPU seconds and memory per (site, name, category)."""
+        stats = collections.OrderedDict()
+        for ev in self.events:
+            key = (ev['args'].get('site'), ev['name'], ev['cat'])
+            s = stats.setdefault(key, {'site': key[0], 'name': key[1], 'cat': key[2],
+                                       'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            s['calls'] += 1
+            s['wall_s'] += ev['dur'] / 1e6
+            s['cpu_s'] += ev['args']['cpu_ms'] / 1e3
+            if self.memory:
+                s['alloc_mb'] = s.get('alloc_mb', 0.0) + ev['args']['alloc_kb'] / 1024
+                s['peak_mb'] = max(s.get('peak_mb', 0.0), ev['args']['peak_kb'] / 1024)
+        return list(stats.values())
+
+    def dump(self, path):
+        """Write the trace events and summary as JSON (Chrome trace format)."""
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms',
+                       'summary': self.summary()}, f)
+
+
+class Sampler:
+    """Stack sampling of one thread on a background thread."""
+
+    def __init__(self, interval = 0.005, thread_id = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target = self._run, daemon = True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        """Write collapsed stacks, one 'frame;frame;... count' line each."""
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def span(name, cat = 'stage'):
+    """A span of the active tracer, or a no-op when no run is traced."""
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.span(name, cat, _active.site())
+
+
+def trace_script(script, out = 'trace.json', memory = True, sample = None, argv = ()):
+    """Run `script` as __main__ with instrumentation; returns the Tracer.
+
+    `sample` is the sampling interval in milliseconds (default: the
+    CIT_PROFILE_SAMPLE environment variable; off when unset). Calls made in
+    worker processes (e.g. falsification_table's pool) are not recorded.
+    """
+    global _active
+    if sample is None and os.environ.get('CIT_PROFILE_SAMPLE'):
+        sample = float(os.environ['CIT_PROFILE_SAMPLE'])
+    tracer = Tracer([script], memory)
+    sampler = Sampler(sample / 1e3) if sample else None
+    if memory:
+        tracemalloc.start()
+    tracer.install()
+    _active = tracer
+    old_argv = sys.argv
+    sys.argv = [script, *argv]
+    if sampler:
+        sampler.start()
+    try:
+        with tracer.span(os.path.basename(script), 'script'):
+            runpy.run_path(os.path.abspath(script), run_name = '__main__')
+    finally:
+        if sampler:
+            sampler.stop()
+            sampler.dump(os.path.splitext(out)[0] + '.samples.txt')
+        sys.argv = old_argv
+        _active = None
+        tracer.uninstall()
+        if memory:
+            tracemalloc.stop()
+        tracer.dump(out)
+    return tracer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Run a replication script with instrumentation.")
+    parser.add_argument('script')
+    parser.add_argument('args', nargs = argparse.REMAINDER)
+    parser.add_argument('--out', default = 'trace.json')
+    parser.add_argument('--no-memory', action = 'store_true',
+                        help = "skip allocation tracking (lower overhead)")
+    parser.add_argument('--sample', type = float,
+                        help = "sampling interval in ms (default: $CIT_PROFILE_SAMPLE)")
+    args = parser.parse_args()
+    tracer = trace_script(args.script, args.out, not args.no_memory, args.sample, args.args)
+    rows = sorted(tracer.summary(), key = lambda s: -s['wall_s'])
+    print(f"{'site':<22}{'call':<28}{'cat':<12}{'calls':>6}{'wall s':>10}{'cpu s':>10}", file = sys.stderr)
+    for s in rows[:40]:
+        print(f"{s['site'] or '-':<22}{s['name']:<28}{s['cat']:<12}{s['calls']:>6}"
+              f"{s['wall_s']:>10.3f}{s['cpu_s']:>10.3f}", file = sys.stderr)
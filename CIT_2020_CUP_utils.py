@@ -0,0 +1,79 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Shared helpers for the replication tools
+#-----------------------------------------------------------------------------#
+
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def _feed(h, obj):
+    # Feed a value into a running hash; arrays are hashed by dtype, shape and
+    # raw bytes, everything else by a tagged repr
+    if isinstance(obj, pd.DataFrame):
+        h.update(b"frame")
+        _feed(h, list(map(str, obj.columns)))
+        for col in obj.columns:
+            _feed(h, obj[col])
+    elif isinstance(obj, pd.Series):
+        _feed(h, obj.to_numpy())
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            obj = np.asarray([str(v) for v in obj.ravel()]).reshape(obj.shape)
+        obj = np.ascontiguousarray(obj)
+        h.update(f"array|{obj.dtype.str}|{obj.shape}|".encode())
+        h.update(obj.tobytes())
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}|{len(obj)}|".encode())
+        for v in obj:
+            _feed(h, v)
+    elif isinstance(obj, dict):
+        h.update(f"dict|{len(obj)}|".encode())
+        for k in sorted(obj, key = str):
+            _feed(h, str(k))
+            _feed(h, obj[k])
+    else:
+        h.update(f"{type(obj).__name__}|{obj!r}|".encode())
+
+
+def digest(*objs):
+    """Content hash (hex sha256) of arrays, pandas objects and plain values."""
+    h = hashlib.sha256()
+    for obj in objs:
+        _feed(h, obj)
+    return h.hexdigest()
+
+
+def parallel_map(func, items, workers = None):
+    """Map `func` over `items` on a process pool, preserving input order.
+
+    `workers` defaults to the number of CPUs; 1 runs serially in-process.
+    Workers are forked so the replication scripts, which have no
+    ``__main__`` guard, are not re-executed in each worker; platforms without
+    fork run serially.
+    """
+    items = list(items)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(items))
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return [func(item) for item in items]
+    ctx = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers = workers, mp_context = ctx) as pool:
+        return list(pool.map(func, items))
+
+
+def file_digest(path, chunk = 1 << 20):
+    """Hex sha256 of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
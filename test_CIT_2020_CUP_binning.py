@@ -0,0 +1,39 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the bin statistics of CIT_2020_CUP_binning against rdplot
+# (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+from rdrobust import rdplot
+
+from CIT_2020_CUP_binning import BinIndex
+from CIT_2020_CUP_data import load_dataset
+
+
+def vars_bins(data, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return rdplot(data.Y, data.X, hide = True, **kwargs).vars_bins
+
+
+@pytest.mark.parametrize('dataset', ['polecon', 'senate'])
+@pytest.mark.parametrize('binselect', ['es', 'qs', 'esmv', 'qsmv', 'espr', 'qspr'])
+def test_bins(dataset, binselect):
+    data = load_dataset(dataset)
+    bins = BinIndex(data.Y, data.X).bins(binselect)
+    pd.testing.assert_frame_equal(bins, vars_bins(data, binselect = binselect), rtol = 1e-9,
+                                  check_dtype = False)
+
+
+@pytest.mark.parametrize('binselect', ['es', 'qs'])
+def test_bins_nbins(binselect):
+    data = load_dataset('polecon')
+    bins = BinIndex(data.Y, data.X).bins(binselect, nbins = 20)
+    pd.testing.assert_frame_equal(bins, vars_bins(data, binselect = binselect, nbins = 20),
+                                  rtol = 1e-9, check_dtype = False)
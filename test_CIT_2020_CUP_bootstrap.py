@@ -0,0 +1,51 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the cluster bootstrap of CIT_2020_CUP_bootstrap against rdrobust
+# (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pandas as pd
+import pytest
+from rdrobust import rdrobust
+
+from CIT_2020_CUP_bootstrap import cluster_bootstrap
+from CIT_2020_CUP_data import DATASETS, load_dataset
+
+
+@pytest.fixture(scope = 'module')
+def data():
+    return load_dataset('senate')
+
+
+@pytest.mark.parametrize('covs', [False, True])
+def test_cluster_bootstrap_estimate(data, covs):
+    covs = data[DATASETS['senate']['covs']] if covs else None
+    boot = cluster_bootstrap(data.Y, data.X, 17.75, cluster = data.state, covs = covs,
+                             reps = 10, seed = 7, workers = 1)
+    est = rdrobust(data.Y, data.X, h = 17.75, covs = covs)
+    np.testing.assert_allclose(boot['coef'], est.coef.iloc[0, 0], rtol = 1e-9)
+
+
+def test_cluster_bootstrap_replicates(data):
+    # Each replicate is the estimate on the data with every state repeated as
+    # many times as it was drawn
+    boot = cluster_bootstrap(data.Y, data.X, 17.75, cluster = data.state, reps = 3,
+                             chunk = 3, seed = 7, workers = 1)
+    codes, uniques = pd.factorize(data.state)
+    G = len(uniques)
+    rng = np.random.default_rng(np.random.SeedSequence(7).spawn(1)[0])
+    counts = rng.multinomial(G, np.full(G, 1 / G), size = 3)
+    for draw, count in zip(boot['draws'], counts):
+        rows = np.repeat(np.arange(len(data)), count[codes])
+        est = rdrobust(data.Y.values[rows], data.X.values[rows], h = 17.75)
+        np.testing.assert_allclose(draw, est.coef.iloc[0, 0], rtol = 1e-9)
+
+
+def test_cluster_bootstrap_workers(data):
+    draws = [cluster_bootstrap(data.Y, data.X, 17.75, cluster = data.state, reps = 250,
+                               chunk = 100, seed = 7, workers = workers)['draws']
+             for workers in (1, 2)]
+    np.testing.assert_array_equal(*draws)
@@ -0,0 +1,51 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the two-tier result cache of CIT_2020_CUP_cache (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import os
+
+from CIT_2020_CUP_cache import ResultCache
+
+
+def _counting(calls):
+    def square(x, power = 2):
+        calls.append(x)
+        return x ** power
+    return square
+
+
+def test_same_call_under_other_spellings_is_a_hit(tmp_path):
+    calls = []
+    cache = ResultCache(str(tmp_path))
+    square = cache(_counting(calls))
+    assert square(3) == square(x = 3) == square(3, power = 2) == 9
+    assert calls == [3] and cache.hits == 2
+
+
+def test_disk_tier_after_memory_eviction(tmp_path):
+    calls = []
+    cache = ResultCache(str(tmp_path), maxsize = 1)
+    square = cache(_counting(calls))
+    square(2)
+    square(3)
+    # 2 is out of the memory tier but still on disk
+    assert cache.key(square.__wrapped__, 2) not in cache._memory
+    assert square(2) == 4
+    assert calls == [2, 3] and cache.hits == 1
+    # A new process (a fresh cache on the same directory) reads the disk tier
+    fresh = ResultCache(str(tmp_path))
+    assert fresh(_counting(calls))(3) == 9
+    assert calls == [2, 3]
+
+
+def test_disk_tier_trimmed_to_budget(tmp_path):
+    calls = []
+    cache = ResultCache(str(tmp_path), maxsize = 0, max_bytes = 0)
+    square = cache(_counting(calls))
+    square(2)
+    assert os.listdir(tmp_path) == []
+    square(2)
+    assert calls == [2, 2]
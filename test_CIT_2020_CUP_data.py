@@ -0,0 +1,31 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the compact dtypes of CIT_2020_CUP_data (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pandas as pd
+
+from CIT_2020_CUP_data import compact_frame
+
+
+def test_float32_only_when_exact():
+    data = pd.DataFrame({'stata': np.float32([0.1, 2.5, np.nan]).astype(float),
+                         'precise': [0.1, 2.5, np.nan],
+                         'huge': [1e300, 1.0, 2.5]})
+    out = compact_frame(data)
+    assert out.stata.dtype == np.float32
+    assert out.precise.dtype == np.float64
+    assert out.huge.dtype == np.float64
+    np.testing.assert_array_equal(out.precise.to_numpy(), data.precise.to_numpy())
+
+
+def test_integers_are_signed():
+    data = pd.DataFrame({'T': [0, 1, 1], 'year': [1994.0, 2008.0, 2010.0]})
+    out = compact_frame(data)
+    assert out['T'].dtype == np.int8
+    assert out.year.dtype == np.int16
+    assert (out['T'] - 1).tolist() == [-1, 0, 0]
+    assert (out.year - 2000).tolist() == [-6, 8, 10]
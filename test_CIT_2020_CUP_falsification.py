@@ -0,0 +1,62 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the falsification scans of CIT_2020_CUP_falsification against
+# rdrobust (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pytest
+from rdrobust import rdrobust
+from scipy.stats import binomtest
+
+from CIT_2020_CUP_data import load_dataset
+from CIT_2020_CUP_falsification import binomial_scan, donut_scan, placebo_scan
+
+
+@pytest.fixture(scope = 'module')
+def data():
+    return load_dataset('polecon')
+
+
+def assert_matches(row, est):
+    np.testing.assert_allclose(row.coef, est.coef.iloc[0, 0], rtol = 1e-9, atol = 1e-10)
+    np.testing.assert_allclose(row.se, est.se.iloc[0, 0], rtol = 1e-9)
+    assert (row.N_h_l, row.N_h_r) == tuple(est.N_h)
+
+
+@pytest.mark.parametrize('kernel, p', [('triangular', 1), ('uniform', 2)])
+def test_placebo_scan(data, kernel, p):
+    # Cutoffs near and far from their anchors, and windows cut short by c
+    cutoffs = [-30.0, -10.0, -2.0, 1.0, 5.0, 25.8]
+    scan = placebo_scan(data.Y, data.X, cutoffs, h = 17.2, p = p, kernel = kernel)
+    for cut, row in zip(cutoffs, scan.itertuples()):
+        side = (data.X >= 0).values if cut >= 0 else (data.X < 0).values
+        est = rdrobust(data.Y, data.X, c = cut, h = 17.2, p = p, kernel = kernel, vce = 'hc0',
+                       subset = side)
+        assert_matches(row, est)
+
+
+def test_placebo_scan_true_cutoff(data):
+    row = placebo_scan(data.Y, data.X, [0.0], h = 17.2).iloc[0]
+    assert row.N_h_l == 0 and np.isnan(row.coef)
+
+
+@pytest.mark.parametrize('kernel, p', [('triangular', 1), ('uniform', 2)])
+def test_donut_scan(data, kernel, p):
+    radii = [0.0, 1.0, 3.0]
+    scan = donut_scan(data.Y, data.X, radii, h = 17.2, p = p, kernel = kernel)
+    for r, row in zip(radii, scan.itertuples()):
+        est = rdrobust(data.Y, data.X, h = 17.2, p = p, kernel = kernel, vce = 'hc0',
+                       subset = (abs(data.X) >= r).values)
+        assert_matches(row, est)
+
+
+def test_binomial_scan(data):
+    windows = [0.5, 2.0, 5.0, 20.0]
+    scan = binomial_scan(data.X, windows = windows)
+    for w, row in zip(windows, scan.itertuples()):
+        inside = data.X[abs(data.X) <= w]
+        assert (row.N_l, row.N_r) == ((inside < 0).sum(), (inside >= 0).sum())
+        np.testing.assert_allclose(row.pv, binomtest(row.N_r, row.N, 0.5).pvalue, rtol = 1e-9)
@@ -0,0 +1,45 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the per-group estimates of CIT_2020_CUP_groups against rdrobust
+# (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pytest
+from rdrobust import rdbwselect, rdrobust
+
+import CIT_2020_CUP_cache
+from CIT_2020_CUP_data import load_dataset
+from CIT_2020_CUP_groups import grouped_rd
+
+
+@pytest.fixture
+def data(monkeypatch):
+    monkeypatch.setattr(CIT_2020_CUP_cache.cache, 'path', None)
+    return load_dataset('senate')
+
+
+def assert_matches(row, est):
+    np.testing.assert_allclose(row.coef, est.coef.iloc[0, 0], rtol = 1e-9)
+    np.testing.assert_allclose(row.se, est.se.iloc[0, 0], rtol = 1e-9)
+    assert (row.N_h_l, row.N_h_r) == tuple(est.N_h)
+
+
+def test_grouped_rd_fixed_bandwidth(data):
+    decade = data.year // 10 * 10
+    table = grouped_rd(data, decade, h = 17.75, vce = 'hc1')
+    assert table.year.tolist() == sorted(decade.unique())
+    for row in table.itertuples():
+        sub = data[decade == row.year]
+        assert_matches(row, rdrobust(sub.Y, sub.X, h = 17.75, vce = 'hc1'))
+
+
+def test_grouped_rd_selected_bandwidths(data):
+    decade = data.year // 10 * 10
+    for row in grouped_rd(data, decade, workers = 1).itertuples():
+        sub = data[decade == row.year]
+        bws = rdbwselect(sub.Y, sub.X, bwselect = 'mserd').bws
+        np.testing.assert_allclose((row.h_l, row.h_r), bws.iloc[0, :2], rtol = 1e-9)
+        assert_matches(row, rdrobust(sub.Y, sub.X, h = (row.h_l, row.h_r), vce = 'hc0'))
@@ -0,0 +1,41 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the local-randomization inference of CIT_2020_CUP_locrand
+# (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+import rdlocrand
+
+from CIT_2020_CUP_data import load_dataset
+from CIT_2020_CUP_locrand import rdrandinf, rdwinselect, recommended_window
+
+
+def test_rdwinselect_without_windows():
+    rng = np.random.default_rng(0)
+    x, z = np.linspace(-1, 1, 15), rng.normal(size = (15, 2))
+    for windows in (None, []):
+        table = rdwinselect(x, z, windows = windows, workers = 1)
+        assert table.empty
+        assert list(table.columns) == ['N_l', 'N_r', 'p_value', 'variable', 'statistic']
+        assert np.isnan(recommended_window(table))
+
+
+@pytest.mark.parametrize('window', [0.75, 2.5])
+@pytest.mark.parametrize('y', ['Y', 'demvoteshlag1', 'demvoteshlag2'])
+def test_rdrandinf(y, window):
+    data = load_dataset('senate').dropna(subset = [y])
+    out = rdrandinf(data[y], data.X, window, reps = 2000, seed = 50)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ref = rdlocrand.rdrandinf(data[y].values, data.X.values, wl = -window, wr = window,
+                                  reps = 2000, seed = 50)
+    np.testing.assert_allclose(out['statistic'], ref['obs.stat'][0], rtol = 1e-9)
+    assert (out['N_l'], out['N_r']) == tuple(ref['sumstats'][1])
+    # Different permutation draws: the p-values agree up to Monte Carlo error
+    assert abs(out['p_value'] - ref['p.value']) < 0.05
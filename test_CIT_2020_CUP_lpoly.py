@@ -0,0 +1,79 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of CIT_2020_CUP_lpoly against rdrobust's conventional estimates at a
+# fixed bandwidth (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pytest
+from rdrobust import rdrobust
+
+from CIT_2020_CUP_data import load_dataset
+from CIT_2020_CUP_lpoly import (Clusters, CovariateIndex, bandwidth_grid, local_linear,
+                                lpoly_batch)
+
+COVS = ['vshr_islam1994', 'partycount', 'lpop1994', 'merkezi', 'merkezp', 'subbuyuk', 'buyuk']
+
+
+@pytest.fixture(scope = 'module')
+def data():
+    return load_dataset('polecon')
+
+
+def assert_matches(coef, se, est, n = None):
+    # Conventional estimate and standard error of an rdrobust fit
+    np.testing.assert_allclose(coef, est.coef.iloc[0, 0], rtol = 1e-9, atol = 1e-10)
+    np.testing.assert_allclose(se, est.se.iloc[0, 0], rtol = 1e-9)
+    if n is not None:
+        assert tuple(n) == tuple(est.N_h)
+
+
+@pytest.mark.parametrize('kernel', ['uniform', 'triangular'])
+@pytest.mark.parametrize('p', [1, 2])
+@pytest.mark.parametrize('vce', ['hc0', 'hc1'])
+def test_lpoly_batch(data, kernel, p, vce):
+    outcomes = ['Y', 'lpop1994', 'i89']
+    fit = lpoly_batch(data[outcomes], data.X, 17.2, p = p, kernel = kernel, vce = vce)
+    for y in outcomes:
+        est = rdrobust(data[y], data.X, h = 17.2, p = p, kernel = kernel, vce = vce)
+        row = fit.loc[y]
+        assert_matches(row.coef, row.se, est, (row.N_h_l, row.N_h_r))
+
+
+def test_lpoly_batch_asymmetric_bandwidths(data):
+    row = lpoly_batch(data[['Y']], data.X, (12.0, 20.0)).iloc[0]
+    assert_matches(row.coef, row.se, rdrobust(data.Y, data.X, h = (12.0, 20.0), vce = 'hc0'),
+                   (row.N_h_l, row.N_h_r))
+
+
+@pytest.mark.parametrize('p', [1, 2])
+def test_lpoly_batch_clusters(data, p):
+    clusters = Clusters(data.prov_num)
+    row = lpoly_batch(data[['Y']], data.X, 17.2, p = p, cluster = clusters).iloc[0]
+    est = rdrobust(data.Y, data.X, h = 17.2, p = p, cluster = data.prov_num, vce = 'cr1')
+    assert_matches(row.coef, row.se, est)
+
+
+def test_local_linear(data):
+    out = local_linear(data.Y, data.X, 17.2, kernel = 'uniform')
+    est = rdrobust(data.Y, data.X, h = 17.2, kernel = 'uniform', vce = 'hc0')
+    assert_matches(out['coef'], out['se'], est, (out['N_h_l'], out['N_h_r']))
+
+
+def test_bandwidth_grid(data):
+    grid = bandwidth_grid(data.Y, data.X, [10.0, 17.2, 30.0], vce = 'hc1')
+    for row in grid.itertuples():
+        est = rdrobust(data.Y, data.X, h = row.h, p = row.p, kernel = row.kernel, vce = 'hc1')
+        assert_matches(row.coef, row.se, est, (row.N_h_l, row.N_h_r))
+
+
+@pytest.mark.parametrize('vce', ['hc0', 'hc1', 'cr1'])
+def test_covariate_index(data, vce):
+    clusters = Clusters(data.prov_num) if vce == 'cr1' else None
+    index = CovariateIndex(data.Y, data.X, data[COVS], p = 1, cluster = clusters)
+    row = index.fit([17.2], vce = vce).iloc[0]
+    est = rdrobust(data.Y, data.X, h = 17.2, covs = data[COVS], vce = vce,
+                   cluster = clusters.labels if clusters else None, subset = index.complete)
+    assert_matches(row.coef, row.se, est, (row.N_h_l, row.N_h_r))
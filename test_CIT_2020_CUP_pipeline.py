@@ -0,0 +1,80 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the stage fingerprints of CIT_2020_CUP_pipeline (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import importlib
+import sys
+
+import pytest
+
+import CIT_2020_CUP_pipeline
+from CIT_2020_CUP_pipeline import Pipeline, replication_pipeline
+
+_STAGES = '''
+def base(offset):
+    from helper_mod import value
+    return value() + offset
+
+
+def double(base):
+    return {factor} * base
+'''
+
+
+@pytest.fixture
+def modules(tmp_path, monkeypatch):
+    # Stage functions in a module of their own, importing a local helper
+    # module; both count as modules of the repository
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(CIT_2020_CUP_pipeline, '_HERE', str(tmp_path))
+    (tmp_path / 'helper_mod.py').write_text('def value():\n    return 1\n')
+    (tmp_path / 'stages_mod.py').write_text(_STAGES.format(factor = 2))
+    yield tmp_path
+    for name in ('helper_mod', 'stages_mod'):
+        sys.modules.pop(name, None)
+
+
+def _pipeline(state_dir):
+    stages = importlib.reload(importlib.import_module('stages_mod'))
+    pipe = Pipeline('test', str(state_dir))
+    pipe.stage('base', params = {'offset': 10})(stages.base)
+    pipe.stage('double', inputs = ['base'])(stages.double)
+    return pipe
+
+
+def test_second_run_skips_unchanged_stages(modules):
+    assert _pipeline(modules / 'state').run(['double']) == {'double': 22}
+    pipe = _pipeline(modules / 'state')
+    assert pipe.run(['double']) == {'double': 22}
+    assert pipe.executed == []
+    pipe.run(['double'], force = True)
+    assert pipe.executed == ['base', 'double']
+
+
+def test_edited_stage_runs_again(modules):
+    _pipeline(modules / 'state').run(['double'])
+    (modules / 'stages_mod.py').write_text(_STAGES.format(factor = 3))
+    pipe = _pipeline(modules / 'state')
+    assert pipe.run(['double']) == {'double': 33}
+    assert pipe.executed == ['double']
+
+
+def test_edited_imported_module_invalidates_its_stages(modules):
+    _pipeline(modules / 'state').run(['double'])
+    (modules / 'helper_mod.py').write_text('def value():\n    return 2\n')
+    sys.modules.pop('helper_mod', None)
+    pipe = _pipeline(modules / 'state')
+    assert pipe.run(['double']) == {'double': 24}
+    assert pipe.executed == ['base', 'double']
+
+
+def test_stage_without_cluster_variable():
+    pipe = replication_pipeline('senate', state_dir = None)
+    with pytest.raises(ValueError, match = 'snippet28 needs a cluster variable'):
+        pipe.order(['snippet28'])
+    with pytest.raises(KeyError):
+        pipe.order(['snippet99'])
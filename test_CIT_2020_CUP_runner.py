@@ -0,0 +1,50 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the multi-dataset runner of CIT_2020_CUP_runner (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import CIT_2020_CUP_cache
+import CIT_2020_CUP_data
+from CIT_2020_CUP_data import DATASETS
+from CIT_2020_CUP_runner import load_specs, run_datasets
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    rng = np.random.default_rng(2)
+    x = rng.uniform(-1, 1, 400)
+    pd.DataFrame({'X': x, 'Y': x + (x >= 0) + rng.normal(0, 0.5, 400)}).to_csv(
+        tmp_path / 'synthetic.csv', index = False)
+    (tmp_path / 'specs.json').write_text(json.dumps(
+        {'synthetic': {'source': 'synthetic.csv', 'h': 0.5, 'covs': []}}))
+    monkeypatch.setattr(CIT_2020_CUP_data, 'CACHE_DIR', str(tmp_path / 'data'))
+    monkeypatch.setattr(CIT_2020_CUP_cache.cache, 'path', None)
+    # Registered by load_specs; removed again after the test
+    monkeypatch.setitem(DATASETS, 'synthetic', None)
+    return load_specs(str(tmp_path / 'specs.json'))[0]
+
+
+def test_load_specs_defaults(dataset):
+    spec = DATASETS[dataset]
+    assert spec['cluster'] is None and spec['bootstrap'] is None
+    assert spec['falsification'] == spec['figure17'] == []
+
+
+def test_second_run_is_cached(dataset, tmp_path):
+    state = str(tmp_path / 'pipeline')
+    first = run_datasets([dataset], ['snippet8', 'snippet12'], workers = 1, state_dir = state)
+    assert first.stage.tolist() == ['data', 'snippet8', 'snippet12']
+    assert (first.status == 'run').all()
+    second = run_datasets([dataset], ['snippet8', 'snippet12'], workers = 1, state_dir = state)
+    assert (second.status == 'cached').all()
+    # Stages the dataset does not define are left out
+    third = run_datasets([dataset], ['snippet8', 'snippet28'], workers = 1, state_dir = state)
+    assert third.stage.tolist() == ['data', 'snippet8']
@@ -0,0 +1,43 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the estimation service of CIT_2020_CUP_service (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import asyncio
+import threading
+
+from CIT_2020_CUP_service import EstimationService
+
+
+def test_rdplot_runs_off_the_event_loop():
+    service = EstimationService()
+    started, release = threading.Event(), threading.Event()
+
+    def slow_rdplot(request):
+        started.set()
+        release.wait(5)
+        return threading.current_thread() is threading.main_thread()
+
+    service._rdplot = slow_rdplot
+
+    async def run():
+        plot = asyncio.ensure_future(service.handle({'id': 1, 'op': 'rdplot'}))
+        while not started.is_set():
+            await asyncio.sleep(0.001)
+        # The loop still answers other requests while the plot is binned
+        stats = await service.handle({'id': 2, 'op': 'stats'})
+        release.set()
+        return stats, await plot
+
+    stats, plot = asyncio.run(run())
+    assert stats['result']['requests'] == 2
+    assert plot == {'id': 1, 'result': False}
+
+
+def test_rdplot_bins():
+    service = EstimationService()
+    response = asyncio.run(service.handle({'id': 1, 'op': 'rdplot', 'dataset': 'senate',
+                                           'binselect': 'es', 'nbins': 10}))
+    assert len(response['result']) == 20
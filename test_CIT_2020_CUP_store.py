@@ -0,0 +1,81 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the result store of CIT_2020_CUP_store (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import CIT_2020_CUP_cache
+import CIT_2020_CUP_data
+import CIT_2020_CUP_store
+from CIT_2020_CUP_data import DATASETS
+from CIT_2020_CUP_store import ResultStore
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    x = rng.uniform(-1, 1, 400)
+    source = tmp_path / 'synthetic.csv'
+    pd.DataFrame({'X': x, 'Y': x + (x >= 0) + rng.normal(0, 0.5, 400)}).to_csv(source, index = False)
+    monkeypatch.setattr(CIT_2020_CUP_data, 'CACHE_DIR', str(tmp_path / 'data'))
+    monkeypatch.setattr(CIT_2020_CUP_cache.cache, 'path', None)
+    monkeypatch.setitem(DATASETS, 'synthetic', {'source': str(source), 'h': 0.5, 'covs': []})
+    return 'synthetic'
+
+
+def _table(store, values):
+    store._tables['bandwidths'] = pd.DataFrame({'key': ['k'] * len(values), 'bwselect': 'mserd',
+                                                'h_l': values, 'h_r': values,
+                                                'b_l': values, 'b_r': values})
+    store._dirty.add('bandwidths')
+
+
+def test_record_estimates_once(dataset, tmp_path):
+    store = ResultStore(str(tmp_path / 'store'))
+    assert store.record(dataset, 'fixed', 'rdrobust', kw = {'h': 0.5})
+    assert not store.record(dataset, 'fixed', 'rdrobust', kw = {'h': 0.5})
+    store.flush()
+    # A new store reads the key back from disk
+    again = ResultStore(str(tmp_path / 'store'))
+    assert not again.record(dataset, 'fixed', 'rdrobust', kw = {'h': 0.5})
+    assert again.record(dataset, 'fixed', 'rdrobust', kw = {'h': 0.4})
+    assert len(again.query(dataset = dataset, name = 'fixed')) == 1
+
+
+def test_last_flush_wins(tmp_path):
+    first, second = ResultStore(str(tmp_path)), ResultStore(str(tmp_path))
+    _table(first, [1.0])
+    _table(second, [2.0, 3.0])
+    first.flush()
+    second.flush()
+    assert ResultStore(str(tmp_path)).table('bandwidths').h_l.tolist() == [2.0, 3.0]
+
+
+def test_flush_displaces_a_table_installed_meanwhile(tmp_path, monkeypatch):
+    first, second = ResultStore(str(tmp_path)), ResultStore(str(tmp_path))
+    _table(first, [1.0])
+    _table(second, [2.0, 3.0])
+    rename = os.rename
+
+    def racing_rename(src, dst):
+        # The second store installs its table right after the first one
+        # moved the old table away, before it installs its own
+        rename(src, dst)
+        if '.old.' in dst and second._dirty:
+            monkeypatch.setattr(CIT_2020_CUP_store.os, 'rename', rename)
+            second.flush()
+
+    initial = ResultStore(str(tmp_path))
+    _table(initial, [0.0])
+    initial.flush()
+    monkeypatch.setattr(CIT_2020_CUP_store.os, 'rename', racing_rename)
+    first.flush()
+    assert ResultStore(str(tmp_path)).table('bandwidths').h_l.tolist() == [1.0]
+    assert sorted(os.listdir(tmp_path)) == ['bandwidths']
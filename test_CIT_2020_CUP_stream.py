@@ -0,0 +1,27 @@
+#-----------------------------------------------------------------------------#
+# A Practical Introduction to Regression Discontinuity Designs: Foundations
+# Authors: Matias D. Cattaneo, Nicolás Idrobo and Rocío Titiunik
+#-----------------------------------------------------------------------------#
+# Checks of the out-of-core estimates of CIT_2020_CUP_stream against rdrobust
+# (python -m pytest)
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pytest
+from rdrobust import rdrobust
+
+from CIT_2020_CUP_data import load_dataset
+from CIT_2020_CUP_stream import stream_estimate
+
+
+@pytest.mark.parametrize('chunksize', [300, 1_000_000])
+def test_stream_estimate(chunksize):
+    data = load_dataset('senate')
+    out = stream_estimate('CIT_2020_CUP_senate.csv', [10.0, 20.0], x = 'demmv',
+                          y = 'demvoteshfor2', chunksize = chunksize)
+    assert len(out) == 8
+    for row in out.itertuples():
+        est = rdrobust(data.Y, data.X, h = row.h, p = row.p, kernel = row.kernel, vce = 'hc0')
+        np.testing.assert_allclose(row.coef, est.coef.iloc[0, 0], rtol = 1e-9)
+        np.testing.assert_allclose(row.se, est.se.iloc[0, 0], rtol = 1e-9)
+        assert (row.N_h_l, row.N_h_r) == tuple(est.N_h)